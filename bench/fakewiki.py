@@ -0,0 +1,318 @@
+###### fakewiki.py - Local MediaWiki API Stand-in ##############################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Local Stand-in for the MediaWiki API
+##
+##  Serves the parts of the MediaWiki API used by the MediaWiki printer
+##  (through mwclient) from memory: logging in, reading the latest revision
+##  of pages (following redirects), fetching tokens, and saving pages with
+##  edit conflict detection. Each request can be delayed to simulate a
+##  distant wiki, and pages over a size limit are refused as a real wiki
+##  would. The requests made and bytes sent each way are counted.
+##
+##  Usage: python bench/fakewiki.py [-p port] [-l latency] [-m max page KiB]
+##                                  [-u username] [-w password]
+##  The wiki is then at http://localhost:<port>/w/ (wikiurl in the printer
+##  config).
+##
+###############################################################################
+
+import BaseHTTPServer, SocketServer, getopt, json, sys, threading, time
+import urlparse
+
+""" In-memory wiki, holding every revision of every page, with counters of
+the requests made to it. """
+class fakewiki:
+  """ Class Constructor. Latency is in seconds, the page size limit in
+  kibibytes (as $wgMaxArticleSize). """
+  def __init__(self, username='user', password='pass', latency=0.0,
+      maxsize=2048):
+    self.username = username
+    self.password = password
+    self.latency = latency
+    self.maxsize = maxsize
+    self.lock = threading.Lock()
+    # Revisions of each page, as (revision id, timestamp, text) tuples
+    self.pages = {}
+    self.lastrev = 0
+    self.sessions = set()
+    self.resetStats()
+
+  """ Resets the request counters. """
+  def resetStats(self):
+    with self.lock:
+      self.requests = {}
+      self.received = 0
+      self.sent = 0
+
+  """ Returns the request counters, as (requests by action, total requests,
+  bytes received, bytes sent). """
+  def stats(self):
+    with self.lock:
+      return (dict(self.requests), sum(self.requests.values()),
+        self.received, self.sent)
+
+  """ Returns a title in the form MediaWiki stores it. """
+  def normalize(self, title):
+    title = title.replace('_', ' ').strip()
+    return title[:1].upper() + title[1:]
+
+  """ Returns the text of the latest revision of a page, or None. """
+  def text(self, title):
+    with self.lock:
+      revs = self.pages.get(self.normalize(title))
+      if not revs:
+        return None
+      return revs[-1][2]
+
+  """ Handles an API request, given its parameters and session cookie,
+  returning the response and any new session cookie. """
+  def handle(self, params, session):
+    action = params.get('action', '')
+    with self.lock:
+      self.requests[action] = self.requests.get(action, 0) + 1
+    if self.latency > 0:
+      time.sleep(self.latency)
+    loggedin = session in self.sessions
+    if action == 'query':
+      return (self.query(params, loggedin), None)
+    if action == 'login':
+      return self.login(params)
+    if action == 'edit':
+      if not loggedin:
+        return (self.error('notloggedin', 'You must be logged in.'), None)
+      return (self.edit(params), None)
+    return (self.error('badvalue', 'Unrecognized action: %s.' % action),
+      None)
+
+  """ Returns an API error response. """
+  def error(self, code, info):
+    return {'error': {'code': code, 'info': info}}
+
+  """ Handles a query: site and user info, tokens and page revisions. """
+  def query(self, params, loggedin):
+    query = {}
+    result = {'query': query}
+    meta = params.get('meta', '').split('|')
+    if 'siteinfo' in meta:
+      query['general'] = {'generator': 'MediaWiki 1.35.0',
+        'sitename': 'Fake Wiki', 'maxarticlesize': self.maxsize * 1024}
+      query['namespaces'] = {'0': {'id': 0, '*': ''}}
+    if 'userinfo' in meta:
+      if loggedin:
+        query['userinfo'] = {'id': 1, 'name': self.username, 'groups': [],
+          'rights': ['edit']}
+      else:
+        query['userinfo'] = {'id': 0, 'name': '127.0.0.1', 'anon': ''}
+    if 'tokens' in meta:
+      tokentype = params.get('type', 'csrf')
+      query['tokens'] = {tokentype + 'token': tokentype + '+\\'}
+    if params.get('curtimestamp'):
+      result['curtimestamp'] = self.timestamp()
+    if 'titles' in params:
+      self.queryPages(params, query)
+    return result
+
+  """ Adds the latest revision of each page asked for to a query response. """
+  def queryPages(self, params, query):
+    titles = []
+    normalized = []
+    for title in params['titles'].split('|'):
+      norm = self.normalize(title)
+      if norm != title:
+        normalized.append({'from': title, 'to': norm})
+      titles.append(norm)
+    if normalized:
+      query['normalized'] = normalized
+    with self.lock:
+      if params.get('redirects'):
+        redirects = []
+        for i in xrange(len(titles)):
+          revs = self.pages.get(titles[i])
+          if revs and revs[-1][2].startswith('#REDIRECT [['):
+            target = self.normalize(revs[-1][2][12:].split(']]')[0])
+            redirects.append({'from': titles[i], 'to': target})
+            titles[i] = target
+        if redirects:
+          query['redirects'] = redirects
+      pages = {}
+      missing = 0
+      for title in titles:
+        revs = self.pages.get(title)
+        if not revs:
+          missing -= 1
+          pages[str(missing)] = {'ns': 0, 'title': title, 'missing': ''}
+          continue
+        revid, timestamp, text = revs[-1]
+        rev = {'revid': revid, 'timestamp': timestamp}
+        if params.get('rvslots'):
+          rev['slots'] = {'main': {'contentmodel': 'wikitext', '*': text}}
+        else:
+          rev['*'] = text
+        pages[str(hash(title) & 0xffffff)] = {'ns': 0, 'title': title,
+          'revisions': [rev]}
+    query['pages'] = pages
+
+  """ Handles a login, returning the response and the new session. """
+  def login(self, params):
+    if params.get('lgname') != self.username or \
+        params.get('lgpassword') != self.password:
+      return ({'login': {'result': 'Failed',
+        'reason': 'Incorrect username or password entered.'}}, None)
+    session = '%x' % (hash((time.time(), len(self.sessions))) & 0xffffffff)
+    with self.lock:
+      self.sessions.add(session)
+    return ({'login': {'result': 'Success', 'lguserid': 1,
+      'lgusername': self.username}}, session)
+
+  """ Handles a page save, detecting edit conflicts from the base revision
+  (or time) given, and refusing pages over the size limit. As on a real wiki,
+  trailing whitespace is not saved. """
+  def edit(self, params):
+    title = self.normalize(params.get('title', ''))
+    # MediaWiki strips trailing whitespace from every page it saves
+    text = params.get('text', '').rstrip()
+    if params.get('token') != 'csrf+\\':
+      return self.error('badtoken', 'Invalid CSRF token.')
+    if len(text) > self.maxsize * 1024:
+      return self.error('contenttoobig', 'The content you supplied ' + \
+        'exceeds the article size limit of %i kibibytes.' % self.maxsize)
+    with self.lock:
+      revs = self.pages.setdefault(title, [])
+      if revs and params.get('createonly'):
+        return self.error('articleexists', 'The article you tried to ' + \
+          'create has been created already.')
+      if not revs and params.get('nocreate'):
+        return self.error('missingtitle', 'The page you specified ' + \
+          'doesn\'t exist.')
+      if revs and ('baserevid' in params or 'basetimestamp' in params):
+        if params.get('baserevid', str(revs[-1][0])) != str(revs[-1][0]) or \
+            params.get('basetimestamp', revs[-1][1]) != revs[-1][1]:
+          return self.error('editconflict', 'Edit conflict.')
+      if revs and revs[-1][2] == text:
+        return {'edit': {'result': 'Success', 'title': title, 'nochange': ''}}
+      oldrevid = 0
+      if revs:
+        oldrevid = revs[-1][0]
+      self.lastrev += 1
+      timestamp = self.timestamp()
+      revs.append((self.lastrev, timestamp, text))
+    return {'edit': {'result': 'Success', 'title': title,
+      'oldrevid': oldrevid, 'newrevid': self.lastrev,
+      'newtimestamp': timestamp}}
+
+  """ Returns the current time as a MediaWiki timestamp. """
+  def timestamp(self):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+""" Request handler, passing API requests to the server's wiki. """
+class apiHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    self.respond(urlparse.urlparse(self.path).query)
+
+  def do_POST(self):
+    length = int(self.headers.get('Content-Length', 0))
+    self.respond(self.rfile.read(length))
+
+  """ Decodes the parameters of a request and sends the wiki's response. """
+  def respond(self, data):
+    wiki = self.server.wiki
+    if urlparse.urlparse(self.path).path != '/w/api.php':
+      self.send_error(404)
+      return
+    params = dict(urlparse.parse_qsl(data, keep_blank_values=True))
+    session = None
+    for cookie in self.headers.getheaders('Cookie'):
+      for part in cookie.split(';'):
+        name, _, value = part.strip().partition('=')
+        if name == 'fakewiki_session':
+          session = value
+    result, newsession = wiki.handle(params, session)
+    body = json.dumps(result)
+    with wiki.lock:
+      wiki.received += len(data) + len(self.path)
+      wiki.sent += len(body)
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json; charset=utf-8')
+    self.send_header('Content-Length', str(len(body)))
+    if newsession != None:
+      self.send_header('Set-Cookie', 'fakewiki_session=%s; Path=/' % \
+        newsession)
+    self.end_headers()
+    self.wfile.write(body)
+
+  # Requests are counted rather than logged
+  def log_message(self, format, *args):
+    pass
+
+""" HTTP server for a fake wiki, handling each connection on its own
+thread. """
+class server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def __init__(self, wiki, port=0):
+    BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), apiHandler)
+    self.wiki = wiki
+
+  """ Returns the URL of the wiki, as given to the MediaWiki printer. """
+  def url(self):
+    return 'http://127.0.0.1:%i/w/' % self.server_address[1]
+
+  """ Serves requests on a background thread. """
+  def start(self):
+    thread = threading.Thread(target=self.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+def main():
+  port = 8080
+  wiki = fakewiki()
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], 'p:l:m:u:w:')
+    for opt, value in opts:
+      if opt == '-p':
+        port = int(value)
+      elif opt == '-l':
+        wiki.latency = float(value)
+      elif opt == '-m':
+        wiki.maxsize = int(value)
+      elif opt == '-u':
+        wiki.username = value
+      elif opt == '-w':
+        wiki.password = value
+  except (getopt.GetoptError, ValueError):
+    sys.stderr.write('Usage: %s [-p port] [-l latency] [-m max page KiB] ' \
+      '[-u username] [-w password]\n' % sys.argv[0])
+    sys.exit(1)
+  httpd = server(wiki, port)
+  sys.stderr.write('Info: Fake wiki at %s\n' % httpd.url())
+  try:
+    httpd.serve_forever()
+  except KeyboardInterrupt:
+    pass
+
+if __name__ == '__main__':
+  main()
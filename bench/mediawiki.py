@@ -0,0 +1,153 @@
+###### mediawiki.py - MediaWiki Printer Benchmark ##############################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Benchmark of the MediaWiki Printer's Round Trips
+##
+##  Starts a local fake wiki (see fakewiki.py) and makes a number of runs of
+##  the MediaWiki printer against it, as mframetest does: the previous
+##  results are loaded, compared with synthetic GCC-scale results, and the
+##  new results stored. For each run, the requests made to the wiki (by API
+##  action), the bytes sent each way and the wall time taken are reported.
+##  Logging in is not counted. Needs mwclient.
+##
+##  Usage: python bench/mediawiki.py [-r runs] [-n failures] [-l latency]
+##                                   [-m max page KiB] [-b max page bytes]
+##                                   [-i index rows]
+##
+###############################################################################
+
+import ConfigParser, getopt, os, random, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+  __file__))))
+from common import regdiff, resultmodel
+import fakewiki
+try:
+  from printers import mediawiki
+except ImportError:
+  sys.stderr.write('Error: The MediaWiki printer needs mwclient.\n')
+  sys.exit(1)
+
+# Sets of results, as found in a GCC test run, with their share of the tests
+_SETS = (('gcc', 0.55), ('g++', 0.25), ('gfortran', 0.1), ('libstdc++', 0.06),
+  ('libgomp', 0.04))
+
+# Share of failures which change from one run to the next
+_CHURN = 0.01
+
+""" Returns a run's results, with about the given number of failures, where
+the failures of each run differ a little from the last. """
+def makeResults(failures, run):
+  rand = random.Random(run)
+  table = resultmodel.nametable()
+  results = {}
+  for name, share in _SETS:
+    fails = []
+    xpasses = []
+    for i in xrange(int(failures * share)):
+      # A few tests fail in alternate runs only
+      if i % int(1 / _CHURN) == 0 and (i + run) % 2:
+        continue
+      fails.append('%s.dg/torture/test-%06i.c   -O%i  (test for excess ' \
+        'errors)' % (name, i, i % 4))
+    for i in xrange(rand.randint(0, 20)):
+      xpasses.append('%s.dg/xpass-%03i.c (test for warnings, line %i)' % \
+        (name, i, i * 7))
+    counts = [int(failures * share * 50), len(fails), len(xpasses),
+      int(failures * share / 4), 3, 0, int(failures * share)]
+    results[name] = resultmodel.section(table, counts,
+      {'FAIL': fails, 'XPASS': xpasses})
+  return results
+
+""" Returns a MediaWiki printer connected to a wiki. """
+def connect(url, maxpagebytes, indexrows):
+  config = ConfigParser.ConfigParser()
+  config.add_section('core')
+  config.add_section('print_mediawiki')
+  for name, value in (('wikiurl', url), ('username', 'user'),
+      ('password', 'pass'), ('index', 'Index'), ('key', 'BENCH'),
+      ('description', 'Benchmark'), ('max_page_bytes', str(maxpagebytes)),
+      ('index_rows', str(indexrows))):
+    config.set('print_mediawiki', name, value)
+  # The printer prints the wiki's URL when connecting
+  stdout = sys.stdout
+  sys.stdout = open(os.devnull, 'w')
+  try:
+    return mediawiki.mediawiki(config)
+  finally:
+    sys.stdout = stdout
+
+def main():
+  runs = 3
+  failures = 20000
+  latency = 0.05
+  maxsize = 2048
+  maxpagebytes = 1048576
+  indexrows = 0
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], 'r:n:l:m:b:i:')
+    for opt, value in opts:
+      if opt == '-r':
+        runs = int(value)
+      elif opt == '-n':
+        failures = int(value)
+      elif opt == '-l':
+        latency = float(value)
+      elif opt == '-m':
+        maxsize = int(value)
+      elif opt == '-b':
+        maxpagebytes = int(value)
+      elif opt == '-i':
+        indexrows = int(value)
+  except (getopt.GetoptError, ValueError):
+    sys.stderr.write('Usage: %s [-r runs] [-n failures] [-l latency] ' \
+      '[-m max page KiB] [-b max page bytes] [-i index rows]\n' % sys.argv[0])
+    sys.exit(1)
+
+  wiki = fakewiki.fakewiki(latency=latency, maxsize=maxsize)
+  httpd = fakewiki.server(wiki)
+  httpd.start()
+  print 'Fake wiki at %s, %.3fs latency, %i KiB page limit' % (httpd.url(),
+    latency, maxsize)
+  print '%-4s %6s %6s %6s %9s %9s %8s' % ('Run', 'Query', 'Edit', 'Total',
+    'Sent KiB', 'Recv KiB', 'Seconds')
+  for run in xrange(1, runs + 1):
+    results = makeResults(failures, run)
+    printer = connect(httpd.url(), maxpagebytes, indexrows)
+    wiki.resetStats()
+    start = time.time()
+    lasttest = printer.loadLastTest()
+    for name in results:
+      regdiff.annotate(name, results[name]['testlist'], lasttest)
+    printer.storeResults('Benchmark run %i' % run, results,
+      {'Test Date': time.strftime('%Y-%m-%d %H:%M:%S')})
+    seconds = time.time() - start
+    printer.cleanup()
+    printer.site.connection.close()
+    actions, total, received, sent = wiki.stats()
+    # Sent and received are from the printer's point of view
+    print '%-4i %6i %6i %6i %9i %9i %8.3f' % (run, actions.get('query', 0),
+      actions.get('edit', 0), total, received // 1024, sent // 1024, seconds)
+  httpd.shutdown()
+
+if __name__ == '__main__':
+  main()
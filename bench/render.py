@@ -0,0 +1,97 @@
+###### render.py - Page Rendering Benchmark ####################################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Benchmark of the Printers' Page Renderers
+##
+##  Renders the pass and diff pages of the GitHub printer (markdown, streamed
+##  to a file) and MediaWiki printer (wiki text, gathered into an upload
+##  buffer) for runs with increasingly many failing tests, reporting the time
+##  per page line. Rendering is linear if this stays flat as the number of
+##  lines grows.
+##
+##  Usage: python bench/render.py [largest number of lines]
+##
+###############################################################################
+
+import os, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+  __file__))))
+from common import regdiff, render, resultmodel
+
+""" Returns a run's results with the given number of failing tests, spread
+over four sets of results, as the DejaGnu tester would give them. """
+def makeResults(lines):
+  table = resultmodel.nametable()
+  results = {}
+  for i in xrange(4):
+    name = 'set%i' % i
+    fails = ['gcc.dg/torture/test-%07i.c   -O2 -flto  (test for excess ' \
+      'errors)' % j for j in xrange(i, lines, 4)]
+    testlist = {'FAIL': fails, 'XPASS': []}
+    regdiff.annotate(name, testlist, {})
+    results[name] = resultmodel.section(table, [0, len(fails), 0, 0, 0, 0, 0],
+      testlist)
+  return results
+
+""" Returns the seconds taken to stream a page's chunks to a file. """
+def timeFile(chunks):
+  f = tempfile.TemporaryFile()
+  start = time.time()
+  for chunk in chunks:
+    f.write(chunk)
+  f.flush()
+  end = time.time()
+  f.close()
+  return end - start
+
+""" Returns the seconds taken to gather a page's chunks into one buffer. """
+def timeBuffer(chunks):
+  start = time.time()
+  ''.join(chunks)
+  return time.time() - start
+
+def main():
+  largest = 100000
+  if len(sys.argv) > 1:
+    largest = int(sys.argv[1])
+  renderers = [('github', render.markdown(), timeFile),
+    ('mediawiki', render.wikitext(), timeBuffer)]
+
+  print '%-10s %-6s %9s %10s %12s' % ('Printer', 'Page', 'Lines', 'Seconds',
+    'us per line')
+  sizes = []
+  lines = largest
+  while lines >= largest // 16 and lines > 0:
+    sizes.insert(0, lines)
+    lines //= 2
+  for lines in sizes:
+    doc = render.model(makeResults(lines), {})
+    for name, markup, measure in renderers:
+      for page, gen in (('pass', markup.genPassTable),
+          ('diff', markup.genDiffTable)):
+        seconds = measure(gen(doc))
+        print '%-10s %-6s %9i %10.3f %12.2f' % (name, page, lines, seconds,
+          seconds * 1000000 / lines)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,183 @@
+###### indexpages.py - Paginated Wiki Index ###################################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Class for Maintaining a Paginated Index of Test Runs on a Wiki
+##
+###############################################################################
+
+import re
+
+""" Class for a paginated wiki index.
+
+The index page holds only the most recent runs. As new rows are added, the
+oldest rows move to archive pages (<index>-Archive-1, -2, ...), each holding
+a fixed number of rows and linking to the one before it, with the index
+linking to the newest. The next test key and the number of archived rows are
+kept on a small state page (<index>-State), so finding the next key does not
+read the index at all. Adding a row reads and writes at most the index,
+state and newest archive page, whatever the number of runs.
+
+Pages are read through a function taking a page name and returning its text,
+or None if it does not exist. An unpaginated index found with no state page
+is moved, unchanged, to <index>-Archive-0. """
+class pagedIndex:
+  _NEXTROW = '<!-- ## NEXTROW ## -->'
+  _ROW     = '<!-- ## ROW ## -->'
+  _ENDROWS = '<!-- ## ENDROWS ## -->'
+
+  """ Index Page Title """
+  _INDEX_TITLE = 'This page contains the summary of test results for %s'
+
+  """ Archive Page Title """
+  _ARCHIVE_TITLE = 'This page contains archived test results for %s ' + \
+    '(part %i)'
+
+  def __init__(self, name, description, rows, chunk, readPage):
+    self.name = name
+    self.description = description
+    self.rows = rows
+    self.chunk = chunk
+    self.readPage = readPage
+    self.state = None
+    self.legacyindex = None
+
+  """ Returns the name of an archive page. """
+  def archiveName(self, part):
+    return '%s-Archive-%i' % (self.name, part)
+
+  """ Returns the name of the state page. """
+  def stateName(self):
+    return self.name + '-State'
+
+  """ Reads the state, returning a (next key, archived rows, legacy) tuple,
+  where legacy is whether an unpaginated index has been archived. Archived
+  rows is None if there is an unpaginated index still to be archived. Returns
+  None if the state (or an unpaginated index) cannot be parsed. """
+  def loadState(self):
+    if self.state != None:
+      return self.state
+    state = self.readPage(self.stateName())
+    if state == None:
+      # Not yet paginated, carry on from any existing index
+      index = self.readPage(self.name)
+      if index == None:
+        self.state = ('1', 0, False)
+        return self.state
+      nextkey = re.search('<!-- ## NEXTKEY ([0-9]*) ## -->', index)
+      if nextkey == None:
+        return None
+      self.legacyindex = index
+      self.state = (nextkey.groups()[0], None, False)
+      return self.state
+    nextkey = re.search('<!-- ## NEXTKEY ([0-9]*) ## -->', state)
+    archived = re.search('<!-- ## ARCHIVED ([0-9]*) ## -->', state)
+    if nextkey == None or archived == None:
+      return None
+    self.state = (nextkey.groups()[0], int(archived.groups()[0]),
+      '<!-- ## LEGACY ## -->' in state)
+    return self.state
+
+  """ Returns the next test key, or None if it cannot be found. """
+  def nextKey(self):
+    state = self.loadState()
+    if state == None:
+      return None
+    return state[0]
+
+  """ Returns the rows of a page, newest first. """
+  def parseRows(self, page):
+    start = page.find(self._NEXTROW)
+    end = page.find(self._ENDROWS)
+    if start < 0 or end < 0:
+      return []
+    rows = page[start + len(self._NEXTROW):end]
+    if rows.endswith('\n'):
+      rows = rows[:-1]
+    return rows.split('\n' + self._ROW)[1:]
+
+  """ Builds a page from a title, its rows and footer. """
+  def buildPage(self, title, rows, footer):
+    return title + '\n{|\n' + self._NEXTROW + \
+      ''.join(['\n' + self._ROW + row for row in rows]) + \
+      '\n' + self._ENDROWS + '\n|}\n' + footer
+
+  """ Adds a row for the next test to the index, returning a list of (page
+  name, text) tuples for the pages to be written. Archive pages come first,
+  so that they exist before anything links to them. If the row is for a
+  given test key, rather than the next one, the next key is moved past it. """
+  def addRow(self, row, key=None):
+    nextkey, archived, legacy = self.loadState()
+    if key == None:
+      key = nextkey
+    nextkey = max(int(nextkey), int(key) + 1)
+    pages = []
+    if archived == None:
+      # Archive an unpaginated index before starting afresh
+      pages.append((self.archiveName(0), self.legacyindex))
+      archived = 0
+      legacy = True
+      rows = []
+    else:
+      index = self.readPage(self.name)
+      rows = []
+      if index != None:
+        rows = self.parseRows(index)
+    rows.insert(0, row)
+
+    # Move the oldest rows to the newest archive pages
+    archives = {}
+    for row in reversed(rows[self.rows:]):
+      part = archived // self.chunk + 1
+      if part not in archives:
+        page = self.readPage(self.archiveName(part))
+        archives[part] = []
+        if page != None:
+          archives[part] = self.parseRows(page)
+      archives[part].insert(0, row)
+      archived += 1
+    rows = rows[:self.rows]
+    for part in sorted(archives):
+      footer = ''
+      if part > 1 or legacy:
+        footer = '[[%s|&laquo; Older results]] | ' % self.archiveName(part - 1)
+      footer += '[[%s|Latest results]]' % self.name
+      pages.append((self.archiveName(part), self.buildPage(
+        self._ARCHIVE_TITLE % (self.description, part), archives[part],
+        footer)))
+
+    # Build the index, linking to the newest archive page
+    footer = ''
+    if archived > 0:
+      footer = '[[%s|Older results &raquo;]]' % \
+        self.archiveName((archived - 1) // self.chunk + 1)
+    elif legacy:
+      footer = '[[%s|Older results &raquo;]]' % self.archiveName(0)
+    pages.append((self.name, self.buildPage(
+      self._INDEX_TITLE % self.description, rows, footer)))
+    state = '<!-- ## NEXTKEY %i ## -->\n<!-- ## ARCHIVED %i ## -->\n' % \
+      (nextkey, archived)
+    if legacy:
+      state += '<!-- ## LEGACY ## -->\n'
+    pages.append((self.stateName(), state))
+    self.state = (str(nextkey), archived, legacy)
+    return pages
@@ -0,0 +1,127 @@
+###### outcomes.py - Columnar Test Outcomes ####################################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Functions for Storing and Comparing the Outcome of Every Test
+##
+##  The outcomes of a set of results are held as two columns: the sorted
+##  list of test names, and a string with a one byte outcome code for each.
+##  Runs of the same tests have identical name columns, so comparing two
+##  runs is usually a comparison of their code strings.
+##
+###############################################################################
+
+import marshal, zlib
+
+# Outcome names, by code. Code 0 is a test that was not run.
+NAMES = ('NOTRUN', 'PASS', 'FAIL', 'XPASS', 'XFAIL', 'KPASS', 'KFAIL',
+  'UNRESOLVED', 'UNTESTED', 'UNSUPPORTED')
+
+# Outcome codes, by the name starting a DejaGnu result line
+CODES = dict([(NAMES[i], chr(i)) for i in xrange(1, len(NAMES))])
+
+# File header: format identifier
+_MAGIC = 'MFTOUTCOMES1'
+
+# Number of codes compared at a time when looking for changes
+_CHUNK = 4096
+
+""" Returns the outcome columns of a set of results, given the names and
+codes of its tests in the order they were run. A test run more than once
+keeps its last outcome. """
+def columns(names, codes):
+  order = sorted(xrange(len(names)), key=names.__getitem__)
+  sortednames = []
+  sortedcodes = bytearray()
+  for i in order:
+    if sortednames and sortednames[-1] == names[i]:
+      sortedcodes[-1] = codes[i]
+      continue
+    sortednames.append(names[i])
+    sortedcodes.append(codes[i])
+  return (sortednames, str(sortedcodes))
+
+""" Returns the outcome columns of every set of results, given as a
+dictionary from set name to (names, codes) columns, in stored form. Each
+column of each set is compressed separately. """
+def dumps(sets):
+  stored = {}
+  for name in sets:
+    names, codes = sets[name]
+    stored[name] = (zlib.compress('\n'.join(names)), zlib.compress(codes))
+  return _MAGIC + marshal.dumps(stored)
+
+""" Returns the outcome columns stored by dumps(). Raises ValueError if the
+data is not stored outcomes. """
+def loads(data):
+  if not data.startswith(_MAGIC):
+    raise ValueError('Not stored test outcomes')
+  stored = marshal.loads(data[len(_MAGIC):])
+  sets = {}
+  for name in stored:
+    names, codes = stored[name]
+    names = zlib.decompress(names)
+    if names == '':
+      sets[name] = ([], zlib.decompress(codes))
+    else:
+      sets[name] = (names.split('\n'), zlib.decompress(codes))
+  return sets
+
+""" Returns the tests whose outcome differs between two sets of outcome
+columns, as a list of (name, old code, new code) tuples in name order.
+
+If both sets hold the same tests, the code strings are compared a chunk at a
+time, and only chunks that differ are looked at test by test. Otherwise the
+sorted name columns are merged. """
+def compare(old, new):
+  oldnames, oldcodes = old
+  newnames, newcodes = new
+  changes = []
+  if oldnames == newnames:
+    for start in xrange(0, len(newcodes), _CHUNK):
+      end = start + _CHUNK
+      if oldcodes[start:end] == newcodes[start:end]:
+        continue
+      for i in xrange(start, min(end, len(newcodes))):
+        if oldcodes[i] != newcodes[i]:
+          changes.append((newnames[i], oldcodes[i], newcodes[i]))
+    return changes
+  i = j = 0
+  while i < len(oldnames) or j < len(newnames):
+    if j == len(newnames) or (i < len(oldnames) and oldnames[i] < newnames[j]):
+      changes.append((oldnames[i], oldcodes[i], '\0'))
+      i += 1
+    elif i == len(oldnames) or newnames[j] < oldnames[i]:
+      changes.append((newnames[j], '\0', newcodes[j]))
+      j += 1
+    else:
+      if oldcodes[i] != newcodes[j]:
+        changes.append((newnames[j], oldcodes[i], newcodes[j]))
+      i += 1
+      j += 1
+  return changes
+
+""" Returns a change from compare() as a line for a list of changed tests,
+in the form '<old outcome> -> <new outcome>: <name>'. """
+def describe(change):
+  name, oldcode, newcode = change
+  return '%s -> %s: %s' % (NAMES[ord(oldcode)], NAMES[ord(newcode)], name)
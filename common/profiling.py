@@ -0,0 +1,131 @@
+###### profiling.py - Per-Plugin Profiling ####################################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Functions for Profiling Each Call Made to a Plugin
+##
+##  Once enabled, each call made through call() is run under its own cProfile
+##  session, and its statistics written to <plugin>.<method>.pstats in the
+##  profile directory (for use with the pstats module or a viewer such as
+##  snakeviz). The memory used by each call is measured with tracemalloc
+##  where it is available, including the lines that allocated the most, and
+##  otherwise from the growth in the peak resident size of the process.
+##  write() adds a summary of every call to summary.txt.
+##
+##  Profiles only cover the thread making the call, and memory is measured
+##  for the whole process, so callers should run plugins one at a time while
+##  profiling is enabled.
+##
+###############################################################################
+
+import cProfile, os, pstats, resource, sys, time, StringIO
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+# Number of functions and allocation sites listed for each call
+_TOP = 15
+
+# Directory profiles are written to, or None if profiling is disabled
+_profiledir = None
+_sessions = []
+# Number of calls made to each plugin method, to name repeated calls apart
+_calls = {}
+
+""" Starts profiling plugin calls, writing profiles to a directory. """
+def enable(directory):
+  global _profiledir
+  if not os.path.exists(directory):
+    os.makedirs(directory)
+  _profiledir = directory
+
+""" Returns whether plugin calls are being profiled. """
+def enabled():
+  return _profiledir != None
+
+""" Calls func with the given arguments, returning its result. If profiling
+is enabled, the call is profiled and recorded as the named method of the
+named plugin. """
+def call(plugin, method, func, *args, **kwargs):
+  if _profiledir == None:
+    return func(*args, **kwargs)
+  name = '%s.%s' % (plugin, method)
+  _calls[name] = _calls.get(name, 0) + 1
+  if _calls[name] > 1:
+    name += '.%i' % _calls[name]
+  session = {'name': name}
+  prof = cProfile.Profile()
+  if tracemalloc != None:
+    tracemalloc.start()
+  else:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  start = time.time()
+  try:
+    return prof.runcall(func, *args, **kwargs)
+  finally:
+    session['time'] = time.time() - start
+    if tracemalloc != None:
+      session['peak'] = tracemalloc.get_traced_memory()[1]
+      session['sites'] = tracemalloc.take_snapshot().statistics('lineno')
+      tracemalloc.stop()
+    else:
+      # ru_maxrss is in kilobytes
+      session['peak'] = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss \
+        - rss) * 1024
+      session['sites'] = None
+    session['stats'] = prof
+    try:
+      prof.dump_stats(os.path.join(_profiledir, name + '.pstats'))
+    except:
+      sys.stderr.write('Warning: Unable to write profile \'%s\'.\n' % name)
+    _sessions.append(session)
+
+""" Writes a summary of every profiled call to summary.txt in the profile
+directory, slowest first, with the functions taking the most cumulative
+time and the lines allocating the most memory in each. """
+def write():
+  if _profiledir == None:
+    return
+  summary = open(os.path.join(_profiledir, 'summary.txt'), 'w')
+  if tracemalloc != None:
+    memory = 'peak traced memory'
+  else:
+    memory = 'peak resident size growth'
+  summary.write('%-40s %10s %12s\n' % ('Call', 'Seconds', 'Memory (KiB)'))
+  sessions = sorted(_sessions, key=lambda s: -s['time'])
+  for session in sessions:
+    summary.write('%-40s %10.3f %12i\n' % (session['name'], session['time'],
+      session['peak'] // 1024))
+  summary.write('\n(Memory is %s.)\n' % memory)
+  for session in sessions:
+    summary.write('\n==== %s ====\n\nTop functions by cumulative time:\n' % \
+      session['name'])
+    out = StringIO.StringIO()
+    stats = pstats.Stats(session['stats'], stream=out)
+    stats.sort_stats('cumulative').print_stats(_TOP)
+    summary.write(out.getvalue())
+    if session['sites'] != None:
+      summary.write('Top lines by allocated memory:\n\n')
+      for stat in session['sites'][:_TOP]:
+        summary.write('  %s\n' % stat)
+  summary.close()
@@ -0,0 +1,83 @@
+###### regdiff.py - Regression Diff Engine ####################################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Functions for comparing the failing tests of two runs, for use by any
+##  tester
+##
+###############################################################################
+
+# Lists of failing tests that are compared between runs
+KINDS = ('FAIL', 'XPASS')
+
+""" Comparison of the failing tests of one set of results against a
+previous run.
+
+Each kind of failure (FAIL, XPASS) is compared separately, using a hashed
+index of each list, so the comparison is linear in the number of tests.
+Lists keep the order the tests were given in, FAIL before XPASS:
+  newfail     - tests failing now that were not before
+  notfail     - tests that failed before but not now
+  fixed       - tests in notfail that were still run
+  disappeared - tests in notfail that were not run at all
+  stillfail   - tests failing in both runs
+Tests are only counted as disappeared if the set of all tests that were
+run is given, otherwise they are counted as fixed. """
+class regdiff:
+  def __init__(self, old, new, seen=None, kinds=KINDS):
+    self.newfail = []
+    self.notfail = []
+    self.fixed = []
+    self.disappeared = []
+    self.stillfail = []
+    for kind in kinds:
+      oldlist = old.get(kind, ())
+      newlist = new.get(kind, ())
+      oldindex = set(oldlist)
+      newindex = set(newlist)
+      for t in newlist:
+        if t not in oldindex:
+          self.newfail.append(t)
+      for t in oldlist:
+        if t in newindex:
+          self.stillfail.append(t)
+          continue
+        self.notfail.append(t)
+        if seen != None and t not in seen:
+          self.disappeared.append(t)
+        else:
+          self.fixed.append(t)
+
+""" Adds lists of newly failed (NEWFAIL) and newly fixed (NOTFAIL) tests to
+a test list, based on the named set of results from a previous run. If the
+set did not exist in the previous run, all failures are new. """
+def annotate(name, testlist, lasttest, seen=None):
+  if name in lasttest:
+    diff = regdiff(lasttest[name], testlist, seen)
+    testlist['NEWFAIL'] = diff.newfail
+    testlist['NOTFAIL'] = diff.notfail
+  else:
+    testlist['NEWFAIL'] = []
+    for kind in KINDS:
+      testlist['NEWFAIL'] += testlist.get(kind, [])
+    testlist['NOTFAIL'] = []
+  return testlist
@@ -0,0 +1,198 @@
+###### render.py - Shared Result Rendering ####################################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Classes for Rendering a Run's Results for the Printers
+##
+##  The results and environment of a run are turned into a document once,
+##  holding everything the printers show in the order they show it, and
+##  shared by every printer through model(). Each printer then writes it out
+##  with one of the markups here: wiki text (MediaWiki pages), markdown (the
+##  list pages of a GitHub wiki, with wiki text tables) or notification text.
+##
+###############################################################################
+
+import threading
+
+# Description of each summary count, in the order of the counts
+_COUNTS = ('expected passes', 'unexpected failures', 'unexpected successes',
+  'expected failures', 'unresolved testcases', 'untested testcases',
+  'unsupported tests')
+
+# Test lists of the pass page, and their headings
+_PASSLISTS = (('FAIL', 'Unexpected Failures'), ('XPASS', 'Unexpected Passes'))
+
+# Test lists of the diff page, and their headings. CHANGED is only present
+# if every test's outcome was captured.
+_DIFFLISTS = (('NEWFAIL', 'Newly Broken'), ('NOTFAIL', 'Newly Fixed'),
+  ('CHANGED', 'Changed Outcomes'))
+
+# The last document built, with the results and environment it was built from
+_cache = (None, None, None)
+_cachelock = threading.Lock()
+
+""" Returns the document of a run's results and environment. The document is
+built by the first printer to ask for it, and shared by the rest. """
+def model(results, env):
+  global _cache
+  with _cachelock:
+    if _cache[0] is not results or _cache[1] is not env:
+      _cache = (results, env, document(results, env))
+    return _cache[2]
+
+""" A run's results and environment, arranged for rendering.
+
+The environment is held as sorted (name, value) rows, and each set of
+results as its name, its counts and the padding they are shown with, and
+the test lists of its pass and diff pages, in the order they are shown. Test
+lists are not copied, so large lists are read from the results as they are
+rendered. Small parts of the output are kept once rendered, so each is only
+rendered once per run whichever printers use it. """
+class document(object):
+  def __init__(self, results, env):
+    self.env = [(name, str(env[name])) for name in sorted(env)]
+    self.summaries = []
+    self.passes = []
+    self.changes = []
+    for name in sorted(results):
+      counts = list(results[name]['results'])
+      # Counts are padded to the width of the largest
+      self.summaries.append((name, counts, len(str(max(counts)))))
+      if 'testlist' in results[name].keys():
+        testlist = results[name]['testlist']
+        self.passes.append((name, [(heading, testlist[kind])
+          for kind, heading in _PASSLISTS]))
+        self.changes.append((name, [(heading, testlist[kind])
+          for kind, heading in _DIFFLISTS if kind in testlist]))
+    self.parts = {}
+    self.lock = threading.Lock()
+
+  """ Returns a part of the output, rendering it with the given function if
+  it has not already been. """
+  def part(self, key, render):
+    with self.lock:
+      if key not in self.parts:
+        self.parts[key] = render()
+      return self.parts[key]
+
+""" Wiki text markup, as used by MediaWiki. Large pages are yielded in
+chunks, so they can be written out as they are rendered. """
+class wikitext(object):
+  # Heading of each set of results, and of each of its test lists
+  HEADINGS = ('== %s ==\n', '=== %s ===\n')
+  # Start of a results table
+  TABLE = '\n{|'
+
+  """ Returns the environment table. """
+  def envTable(self, doc):
+    return doc.part((self.TABLE, 'env'),
+      lambda: ''.join(self.genEnvTable(doc)))
+
+  """ Returns the results table, with the given number of sets a row. """
+  def resultTable(self, doc, width):
+    return doc.part((self.TABLE, 'results', width),
+      lambda: ''.join(self.genResultTable(doc, width)))
+
+  """ Builds list of unexpected failures, yielding it in chunks. """
+  def genPassTable(self, doc):
+    return self.genLists(doc.passes)
+
+  """ Builds table of newly broken/fixed tests, yielding it in chunks. """
+  def genDiffTable(self, doc):
+    return self.genLists(doc.changes)
+
+  """ Builds a page of test lists for each set of results, yielding it in
+  chunks. """
+  def genLists(self, sets):
+    for name, lists in sets:
+      yield self.HEADINGS[0] % name
+      for heading, tests in lists:
+        yield self.HEADINGS[1] % heading
+        for test in tests:
+          yield '    ' + test + '\n'
+      yield '\n'
+
+  """ Builds table of environment variables, yielding it in chunks. """
+  def genEnvTable(self, doc):
+    yield '{|'
+    for name, value in doc.env:
+      yield '\n|-\n! ' + name + ' || ' + value
+    yield '\n|}'
+
+  """ Builds results table, yielding it in chunks. """
+  def genResultTable(self, doc, width):
+    colid = 0
+    yield self.TABLE
+    for name, counts, pad in doc.summaries:
+      if colid == 0:
+        yield '\n|-'
+      yield '\n|| \'\'\'%s\'\'\'<pre>' % name
+      for i in xrange(len(_COUNTS)):
+        if counts[i] > 0:
+          yield '\n%s %s ' % (str(counts[i]).rjust(pad), _COUNTS[i])
+      yield '</pre>'
+      colid = (colid + 1) % width
+    yield '\n|}\n'
+
+  """ Returns the failures and unexpected passes listed on a pass page, as a
+  dictionary from set name to test lists. Raises an exception if the page
+  is not a pass page. """
+  def parsePassTable(self, page):
+    setstart, setend = self.HEADINGS[0][:-1].split('%s')
+    liststart, listend = self.HEADINGS[1][:-1].split('%s')
+    kinds = dict([(self.HEADINGS[1][:-1] % heading, kind)
+      for kind, heading in _PASSLISTS])
+    results = {}
+    for line in page.split('\n'):
+      # New test set
+      if line.startswith(setstart) and line.endswith(setend):
+        test = {}
+        results[line[len(setstart):len(line)-len(setend)]] = test
+      elif line.startswith(liststart) and line.endswith(listend):
+        testlist = []
+        if line in kinds:
+          test[kinds[line]] = testlist
+      else:
+        testlist.append(line[4:])
+    return results
+
+""" Markdown markup, as used for the list pages of a GitHub wiki. Tables are
+still wiki text, which GitHub also renders. """
+class markdown(wikitext):
+  HEADINGS = ('## %s\n', '### %s\n')
+  TABLE = '{|'
+
+""" Plain text markup for desktop notifications. """
+class notification(object):
+  """ Returns a (title, text) notification for each set of results. """
+  def summaries(self, doc):
+    return doc.part(('notification', 'summaries'), lambda: [
+      ('Test Complete: ' + name, self.summary(counts))
+      for name, counts, pad in doc.summaries])
+
+  """ Formats one set of summary results. """
+  def summary(self, counts):
+    text = 'Results: '
+    for i in xrange(len(_COUNTS)):
+      if counts[i] > 0:
+        text += '%i %s. ' % (counts[i], _COUNTS[i])
+    return text
@@ -0,0 +1,178 @@
+###### resultcache.py - Test Result Cache ######################################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Class for Caching Test Results Between Runs of the Same Sources
+##
+###############################################################################
+
+import cPickle, fnmatch, hashlib, os, sys, zlib
+from common import regdiff
+
+""" Class for a local, content addressed store of test results.
+
+Results are stored under a key made from the test environment entries that
+identify the sources being tested (by default the git_* entries of the
+githeads preloader) and the tester's configuration. If a later run has the
+same key, its results are reused instead of running the tester. Sources with
+uncommitted changes (a value ending in '*') are never cached. Once the store
+grows past its size limit, the least recently used results are removed. """
+class resultcache:
+  _CONFIGKEY = 'cache'
+  config   = None
+  verbose  = False
+  cachedir = None
+  maxsize  = 256 * 1024 * 1024
+  keys     = ['git_*']
+
+  """ Class Constructor. Loads and parses configuration. """
+  def __init__(self, config):
+    # Load config and set variables
+    self.config = config
+    try:
+      if config.get('core', 'verbose') == '1':
+        self.verbose = True
+    except:
+      pass
+
+    self.cachedir = self.getConfig('dir')
+    if self.cachedir == None:
+      sys.stderr.write('Error: Cache config is missing directory.\n')
+      sys.exit(1)
+    if self.cachedir[0] != '/':
+      self.cachedir = os.getcwd() + '/' + self.cachedir
+    maxsize = self.getConfig('size')
+    if maxsize != None:
+      try:
+        self.maxsize = int(maxsize) * 1024 * 1024
+      except ValueError:
+        sys.stderr.write('Error: Invalid cache size.\n')
+        sys.exit(1)
+    keys = self.getConfig('keys')
+    if keys != None:
+      self.keys = [k.strip() for k in keys.split(',')]
+
+  """ Helper function to pull class-specific configuration variables """
+  def getConfig(self, name):
+    if not self.config:
+      sys.stderr.write('Error: Tried to load config with no config loaded')
+      sys.exit(1)
+    try:
+      return self.config.get(self._CONFIGKEY, name)
+    except:
+      return None
+
+  """ Returns the key for a run of the named tester in the given environment,
+  or None if the run should not be cached. """
+  def getKey(self, testname, testsection, env):
+    entries = []
+    for name in sorted(env):
+      for pattern in self.keys:
+        if fnmatch.fnmatch(name, pattern):
+          break
+      else:
+        continue
+      value = str(env[name]).strip()
+      # Never cache sources with uncommitted changes
+      if value.endswith('*'):
+        if self.verbose:
+          sys.stderr.write('Info: \'%s\' is modified, not caching.\n' % name)
+        return None
+      entries.append((name, value))
+    # Without any sources to identify the run, every run would match
+    if entries == []:
+      if self.verbose:
+        sys.stderr.write('Info: No cache key entries found, not caching.\n')
+      return None
+    settings = []
+    if self.config.has_section(testsection):
+      settings = sorted(self.config.items(testsection, raw=True))
+    return hashlib.sha1(repr((testname, entries, settings))).hexdigest()
+
+  """ Returns the path of the cache file for a key. """
+  def getPath(self, key):
+    return self.cachedir + '/' + key[:2] + '/' + key
+
+  """ Returns the cached results for a key, with newly failed/fixed tests
+  recalculated against lasttest, or None if there are none. Tests whose
+  captured outcome changed are dropped, as they were found against whichever
+  run came before the cached one, and no outcomes are captured without
+  running the tester. """
+  def load(self, key, lasttest):
+    path = self.getPath(key)
+    if not os.path.exists(path):
+      return None
+    try:
+      results = cPickle.loads(zlib.decompress(file(path, 'rb').read()))
+      # Mark as recently used
+      os.utime(path, None)
+    except:
+      sys.stderr.write('Warning: Unable to read cached results.\n')
+      return None
+    for name in results:
+      if 'testlist' in results[name].keys():
+        testlist = results[name]['testlist']
+        regdiff.annotate(name, testlist, lasttest)
+        if 'CHANGED' in testlist:
+          del testlist['CHANGED']
+    return results
+
+  """ Stores the results for a key, then evicts old results if needed. """
+  def store(self, key, results):
+    path = self.getPath(key)
+    try:
+      if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+      # Write to a temporary file first so a partial entry is never read
+      tmp = '%s.%i.tmp' % (path, os.getpid())
+      file(tmp, 'wb').write(zlib.compress(cPickle.dumps(results, 2)))
+      os.rename(tmp, path)
+    except:
+      sys.stderr.write('Warning: Unable to store results in cache.\n')
+      return
+    self.evict()
+
+  """ Removes the least recently used results until the cache is within its
+  size limit. """
+  def evict(self):
+    entries = []
+    total = 0
+    for root, dirs, files in os.walk(self.cachedir):
+      for name in files:
+        path = os.path.join(root, name)
+        try:
+          st = os.stat(path)
+        except OSError:
+          continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+    entries.sort()
+    while total > self.maxsize and entries:
+      mtime, size, path = entries.pop(0)
+      try:
+        os.remove(path)
+        total -= size
+        if self.verbose:
+          sys.stderr.write('Info: Evicted cached results \'%s\'.\n' % \
+            os.path.basename(path))
+      except OSError:
+        pass
@@ -0,0 +1,243 @@
+###### resultmodel.py - Compact Test Results ###################################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Classes for Holding a Run's Results Compactly
+##
+##  A set of results is normally passed around as
+##    {'results': [7 counts],
+##     'testlist': {'FAIL': [...], 'XPASS': [...], 'NEWFAIL': [...], ...}}
+##  The classes here hold the same information in far less memory, while
+##  still being read (and the test lists written) in exactly the same way, so
+##  printers and other code need not know which they have been given.
+##
+###############################################################################
+
+import array, bisect, zlib
+
+# Size of each block of names before it is compressed
+_BLOCK = 65536
+
+""" Table of test names, each stored once and referred to by id.
+
+Names are kept end to end in blocks of about _BLOCK bytes, rather than as a
+string object apiece, with an array of where each ends. Full blocks are
+compressed; test names share long runs of directories and options, so this
+keeps them in a fraction of their size. The most recently read block is kept
+uncompressed, and names are almost always read in the order they were added,
+so each block is only decompressed once per pass.
+
+Names are found through an open addressing hash index, an array of ids, with
+the hash of every name kept so that only names with the same hash need to be
+read to compare them. """
+class nametable(object):
+  __slots__ = ('blocks', 'current', 'firsts', 'ends', 'hashes', 'index',
+    'cache')
+
+  def __init__(self):
+    self.blocks = []
+    self.current = bytearray()
+    self.firsts = array.array('I', [0])
+    self.ends = array.array('I')
+    self.hashes = array.array('l')
+    # Id + 1 of the name in each slot, or 0 if empty
+    self.index = array.array('I', [0]) * 64
+    self.cache = (None, None)
+
+  """ Returns the id of a name, adding it if needed. """
+  def intern(self, name):
+    h = hash(name)
+    index = self.index
+    mask = len(index) - 1
+    slot = h & mask
+    while index[slot]:
+      i = index[slot] - 1
+      if self.hashes[i] == h and self.name(i) == name:
+        return i
+      slot = (slot + 1) & mask
+    i = len(self.ends)
+    if len(self.current) + len(name) > _BLOCK and len(self.current) > 0:
+      self.blocks.append(zlib.compress(str(self.current)))
+      self.current = bytearray()
+      self.firsts.append(i)
+    self.current += name
+    self.ends.append(len(self.current))
+    self.hashes.append(h)
+    index[slot] = i + 1
+    # Keep the index no more than two thirds full
+    if (i + 1) * 3 > len(index) * 2:
+      self.rehash(len(index) * 2)
+    return i
+
+  """ Rebuilds the hash index with the given number of slots. """
+  def rehash(self, size):
+    index = array.array('I', [0]) * size
+    mask = size - 1
+    for i in xrange(len(self.hashes)):
+      slot = self.hashes[i] & mask
+      while index[slot]:
+        slot = (slot + 1) & mask
+      index[slot] = i + 1
+    self.index = index
+
+  """ Returns the name with the given id. """
+  def name(self, i):
+    block = bisect.bisect_right(self.firsts, i) - 1
+    if block == len(self.blocks):
+      data = self.current
+    else:
+      cache = self.cache
+      if cache[0] == block:
+        data = cache[1]
+      else:
+        data = zlib.decompress(self.blocks[block])
+        self.cache = (block, data)
+    start = 0
+    if i != self.firsts[block]:
+      start = self.ends[i-1]
+    return str(data[start:self.ends[i]])
+
+  def __len__(self):
+    return len(self.ends)
+
+  # The uncompressed block is not stored when pickled
+  def __getstate__(self):
+    return dict([(a, getattr(self, a)) for a in self.__slots__
+      if a != 'cache'])
+
+  def __setstate__(self, state):
+    for a in state:
+      setattr(self, a, state[a])
+    self.cache = (None, None)
+
+""" Read only list of test names, held as an array of ids into a name
+table. """
+class namelist(object):
+  __slots__ = ('table', 'ids')
+
+  def __init__(self, table, ids):
+    self.table = table
+    self.ids = ids
+
+  def __len__(self):
+    return len(self.ids)
+
+  def __iter__(self):
+    name = self.table.name
+    for i in self.ids:
+      yield name(i)
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self.table.name(j) for j in self.ids[i]]
+    return self.table.name(self.ids[i])
+
+  def __contains__(self, test):
+    return test in list(self)
+
+  def __add__(self, other):
+    return list(self) + list(other)
+
+  def __eq__(self, other):
+    return list(self) == list(other)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return repr(list(self))
+
+""" Test lists of a set of results, used as a dictionary of lists of names
+(FAIL, XPASS, NEWFAIL, ...). Lists of names stored in it are converted to
+arrays of ids. """
+class testlist(object):
+  __slots__ = ('section',)
+
+  def __init__(self, section):
+    self.section = section
+
+  def __getitem__(self, kind):
+    return namelist(self.section.table, self.section.lists[kind])
+
+  def __setitem__(self, kind, names):
+    intern = self.section.table.intern
+    self.section.lists[kind] = array.array('I', [intern(t) for t in names])
+
+  def __delitem__(self, kind):
+    del self.section.lists[kind]
+
+  def __contains__(self, kind):
+    return kind in self.section.lists
+
+  def __iter__(self):
+    return iter(self.section.lists)
+
+  def __len__(self):
+    return len(self.section.lists)
+
+  def get(self, kind, default=None):
+    if kind in self.section.lists:
+      return self[kind]
+    return default
+
+  def keys(self):
+    return self.section.lists.keys()
+
+  def items(self):
+    return [(kind, self[kind]) for kind in self.section.lists]
+
+""" One set of results: its summary counts, as an array, and its test lists,
+as arrays of ids into a name table shared by every set in the run. Used as a
+dictionary with 'results' and 'testlist' entries. """
+class section(object):
+  __slots__ = ('table', 'counts', 'lists')
+
+  _KEYS = ('results', 'testlist')
+
+  def __init__(self, table, counts, testlists):
+    self.table = table
+    self.counts = array.array('i', counts)
+    self.lists = {}
+    view = testlist(self)
+    for kind in testlists:
+      view[kind] = testlists[kind]
+
+  def __getitem__(self, key):
+    if key == 'results':
+      return self.counts
+    if key == 'testlist':
+      return testlist(self)
+    raise KeyError(key)
+
+  def __contains__(self, key):
+    return key in self._KEYS
+
+  def __iter__(self):
+    return iter(self._KEYS)
+
+  def keys(self):
+    return list(self._KEYS)
+
+  def get(self, key, default=None):
+    if key in self._KEYS:
+      return self[key]
+    return default
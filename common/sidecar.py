@@ -0,0 +1,84 @@
+###### sidecar.py - Machine Readable Results ##################################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Functions for Storing Results in a Compact, Machine Readable Form
+##
+##  Printers that store human readable pages can store one of these next to
+##  them, so that the results can be read back without parsing the pages.
+##
+###############################################################################
+
+import array, marshal, sys, zlib
+
+# File header: format identifier, followed by the byte order of the arrays
+_MAGIC = 'MFTSIDECAR1'
+
+# Lists of tests that are stored for each set of results
+_KINDS = ('FAIL', 'XPASS')
+
+""" Returns the results in sidecar form.
+
+Each test name is stored once in a table, and each set of results holds its
+summary counts and, for FAIL and XPASS, an array of indexes into that
+table. The whole is marshalled and compressed. """
+def dumps(results):
+  names = []
+  ids = {}
+  sections = {}
+  for name in sorted(results):
+    lists = []
+    testlist = {}
+    if 'testlist' in results[name].keys():
+      testlist = results[name]['testlist']
+    for kind in _KINDS:
+      index = array.array('I')
+      for test in testlist.get(kind, ()):
+        if test not in ids:
+          ids[test] = len(names)
+          names.append(test)
+        index.append(ids[test])
+      lists.append(index.tostring())
+    sections[name] = (list(results[name]['results']), lists[0], lists[1])
+  return _MAGIC + sys.byteorder[0] + zlib.compress(marshal.dumps((names,
+    sections)))
+
+""" Returns the results stored by dumps(), in the same form as returned by a
+printer's loadLastTest(), with the summary counts added as 'results'. Raises
+ValueError if the data is not a sidecar. """
+def loads(data):
+  if not data.startswith(_MAGIC):
+    raise ValueError('Not a results sidecar')
+  byteorder = data[len(_MAGIC)]
+  names, sections = marshal.loads(zlib.decompress(data[len(_MAGIC)+1:]))
+  results = {}
+  for name in sections:
+    counts, fail, xpass = sections[name]
+    test = {'results': counts}
+    for kind, ids in zip(_KINDS, (fail, xpass)):
+      index = array.array('I')
+      index.fromstring(ids)
+      if byteorder != sys.byteorder[0]:
+        index.byteswap()
+      test[kind] = [names[i] for i in index]
+    results[name] = test
+  return results
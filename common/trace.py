@@ -0,0 +1,104 @@
+###### trace.py - Run Timing Trace #############################################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Functions for Recording the Time Spent in Each Part of a Run
+##
+##  Spans are recorded with
+##    with trace.span('name', arg=value):
+##      ...
+##  and, once enabled, written as Chrome trace event JSON (which can be loaded
+##  into chrome://tracing or Perfetto). Spans nest by time on each thread.
+##  Until trace.enable() is called, span() returns a shared object that does
+##  nothing, so plugins can add spans freely.
+##
+###############################################################################
+
+import json, os, threading, time
+
+# Recorded events, or None if tracing is disabled
+_events = None
+_lock = threading.Lock()
+
+""" Span that does nothing, used while tracing is disabled. """
+class _nospan:
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    return False
+
+_NOSPAN = _nospan()
+
+""" Span that records the time between entering and leaving it. """
+class _span:
+  def __init__(self, name, args):
+    self.name = name
+    self.args = args
+
+  def __enter__(self):
+    self.start = time.time()
+    return self
+
+  def __exit__(self, *exc):
+    complete(self.name, self.start, time.time(), **self.args)
+    return False
+
+""" Starts recording spans. """
+def enable():
+  global _events
+  _events = []
+
+""" Returns whether spans are being recorded. """
+def enabled():
+  return _events != None
+
+""" Returns a span for use in a with statement. Keyword arguments are shown
+with the span. """
+def span(name, **args):
+  if _events == None:
+    return _NOSPAN
+  return _span(name, args)
+
+""" Records a span that has already finished, given its start and end times
+(from time.time()). Spans timed in another process can be recorded with tid
+set to that process's id, so they are shown on a row of their own. """
+def complete(name, start, end, tid=None, **args):
+  if _events == None:
+    return
+  if tid == None:
+    tid = threading.current_thread().ident
+  event = {'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+    'ts': int(start * 1000000), 'dur': int((end - start) * 1000000)}
+  if args:
+    event['args'] = args
+  with _lock:
+    _events.append(event)
+
+""" Writes the recorded spans to a file as Chrome trace event JSON. """
+def write(filename):
+  if _events == None:
+    return
+  with _lock:
+    events = sorted(_events, key=lambda e: (e['ts'], -e['dur']))
+  json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'},
+    open(filename, 'w'))
@@ -26,7 +26,8 @@
 ##
 ###############################################################################
 
-import ConfigParser, sys
+import atexit, ConfigParser, getopt, sys, threading, time
+from common import profiling, resultcache, trace
 
 # Configuration and runtime variables
 configname = None
@@ -50,17 +51,196 @@ def getConfig(section, name):
       (section, name))
     return None
 
+""" Returns the timeout (in seconds) of a printer, from 'timeout' in its own
+config section, or 'printer_timeout' in the core section, or None if neither
+is set. Exits if the timeout is not a positive number. """
+def printerTimeout(p):
+  timeout = None
+  if hasattr(p, '_CONFIGKEY') and config.has_option(p._CONFIGKEY, 'timeout'):
+    timeout = config.get(p._CONFIGKEY, 'timeout')
+  elif config.has_option('core', 'printer_timeout'):
+    timeout = config.get('core', 'printer_timeout')
+  if timeout == None:
+    return None
+  try:
+    timeout = float(timeout)
+  except ValueError:
+    timeout = 0
+  if not timeout > 0:
+    sys.stderr.write('Error: Invalid timeout for Printer \'%s\'.\n' % \
+      p.__class__.__name__)
+    sys.exit(1)
+  return timeout
+
+""" Function for passing results to every printer. Printers are run at the
+same time, each on its own thread, apart from those with a true 'serial'
+attribute, which are run in turn on this thread meanwhile. While profiling,
+every printer is run in turn. Each concurrent printer is given the timeout
+(in seconds) from 'timeout' in its own config section, or 'printer_timeout'
+in the core section, if set. Returns a list of (printer, reason) tuples for
+each printer that failed or did not finish in time. """
+def storeResults(rundesc, results, env):
+  failures = []
+  def run(p, outcome):
+    try:
+      with trace.span('storeResults', printer=p.__class__.__name__):
+        profiling.call(p.__class__.__name__, 'storeResults', p.storeResults,
+          rundesc, results, env)
+      outcome.append(None)
+    except SystemExit:
+      outcome.append('exited')
+    except:
+      outcome.append(str(sys.exc_info()[1]))
+
+  def start(p):
+    timeout = printerTimeout(p)
+    deadline = None
+    if timeout != None:
+      deadline = time.time() + timeout
+    outcome = []
+    thread = threading.Thread(target=run, args=(p, outcome))
+    thread.daemon = True
+    thread.start()
+    return (p, thread, outcome, deadline)
+
+  def wait(p, thread, outcome, deadline):
+    if deadline == None:
+      thread.join()
+    else:
+      thread.join(max(0, deadline - time.time()))
+    if thread.isAlive():
+      failures.append((p, 'timed out'))
+    elif outcome[0] != None:
+      failures.append((p, outcome[0]))
+
+  # Start all concurrent printers, then run serial ones while they work
+  def serial(p):
+    return getattr(p, 'serial', False) or profiling.enabled()
+  running = [start(p) for p in printer if not serial(p)]
+  for p in printer:
+    if serial(p):
+      outcome = []
+      run(p, outcome)
+      if outcome[0] != None:
+        failures.append((p, outcome[0]))
+  for job in running:
+    wait(*job)
+  return failures
+
+""" Function for answering queries about a test from the history printer's
+database, given the arguments after 'query':
+  first-fail <test> <config>  Shows the run in which the test started failing
+                              (most recently) and the git_* commits between it
+                              and the run before
+  flips <test> <config>       Shows every run in which the test started or
+                              stopped failing """
+def query(args):
+  global config
+  if len(args) != 3 or args[0] not in ('first-fail', 'flips'):
+    sys.stderr.write('Error: Usage: query first-fail|flips <test> <config>\n')
+    sys.exit(1)
+  command, test, configname = args
+  try:
+    config = ConfigParser.SafeConfigParser()
+    config.readfp(open(configname))
+  except:
+    sys.stderr.write('Error: Unable to load config \'%s\'.\n' % (configname))
+    sys.exit(1)
+  from printers import history
+  db = history.history(config)
+
+  def describe(run, runtime, desc):
+    text = 'run %i, %s' % (run, time.strftime('%b %d, %Y %H:%M',
+      time.localtime(runtime)))
+    if desc:
+      text += ' (%s)' % desc
+    return text
+
+  flips = db.flips(test)
+  if flips == []:
+    print 'Test \'%s\' has never failed under \'%s\'.' % (test, db.key)
+  sections = []
+  for flip in flips:
+    if flip[0] not in sections:
+      sections.append(flip[0])
+  for section in sections:
+    runs = [flip[1:] for flip in flips if flip[0] == section]
+    print '%s: %s' % (section, test)
+    if command == 'flips':
+      for run, kind, runtime, desc in runs:
+        print '  %-12s %s' % (kind or 'not failing', describe(run, runtime,
+          desc))
+      continue
+    # Find the start of the latest run of failures
+    start = None
+    for i in xrange(len(runs)):
+      if runs[i][1] != None and (i == 0 or runs[i-1][1] == None):
+        start = i
+    run, kind, runtime, desc = runs[start]
+    print '  Started failing (%s) in %s' % (kind, describe(run, runtime, desc))
+    prevrun = db.previousRun(run)
+    if prevrun == None:
+      print '  This was the first run stored'
+    else:
+      oldenv = db.runEnv(prevrun)
+      newenv = db.runEnv(run)
+      for name in sorted(newenv):
+        if name.startswith('git_'):
+          print '  %s: %s..%s' % (name, oldenv.get(name, '?'), newenv[name])
+    for run, kind, runtime, desc in runs[start+1:]:
+      if kind == None:
+        print '  Stopped failing in %s' % describe(run, runtime, desc)
+        break
+    if start > 0:
+      print '  It flipped %i times before this' % start
+  db.cleanup()
+
 """ Main Function. This function loads a configuration file, sets up the
 required classes and structures and starts tests """
 def main():
   global configname
   global config
+  # Options come before the config file
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], '', ['trace=', 'profile='])
+  except getopt.GetoptError, e:
+    sys.stderr.write('Error: %s\n' % e)
+    sys.exit(1)
+  for opt, value in opts:
+    if opt == '--trace':
+      # Written on exit, so runs that fail are traced too
+      def writeTrace(tracefile=value):
+        try:
+          trace.write(tracefile)
+        except:
+          sys.stderr.write('Warning: Unable to write trace \'%s\'.\n' % \
+            tracefile)
+      trace.enable()
+      atexit.register(writeTrace)
+    elif opt == '--profile':
+      # Each plugin call is profiled and a summary written on exit
+      def writeProfile():
+        try:
+          profiling.write()
+        except:
+          sys.stderr.write('Warning: Unable to write profile summary.\n')
+      try:
+        profiling.enable(value)
+      except OSError:
+        sys.stderr.write('Error: Unable to create profile directory ' + \
+          '\'%s\'.\n' % value)
+        sys.exit(1)
+      atexit.register(writeProfile)
+  # Queries of stored results take their own arguments
+  if len(args) > 0 and args[0] == 'query':
+    query(args[1:])
+    return
   # If no config file has been passed, then error
-  if len(sys.argv) == 1:
+  if len(args) == 0:
     sys.stderr.write('Error: Config File Required\n')
     sys.exit(1)
   try:
-    configname = sys.argv[1]
+    configname = args[0]
     config = ConfigParser.SafeConfigParser()
     config.readfp(open(configname))
   except:
@@ -68,8 +248,8 @@ def main():
     sys.exit(1)
 
   # The next argument will be a variable (if specifed) will give us a comment to put next to the results
-  if len(sys.argv) > 2:
-    rundesc = sys.argv[2]
+  if len(args) > 1:
+    rundesc = args[1]
   else:
     rundesc = ''
 
@@ -83,7 +263,9 @@ def main():
   testname = getConfig('core', 'tester')
   try:
     mod = __import__('testers.' + testname)
-    tester = eval('mod.' + testname + '.' + testname + '(config)')
+    with trace.span('construct', plugin=testname):
+      tester = profiling.call(testname, '__init__',
+        eval('mod.' + testname + '.' + testname), config)
   except:
     sys.stderr.write('Error: Unable to load Tester \'%s\'.\n' % \
       (testname))
@@ -94,25 +276,64 @@ def main():
     printname = printname.replace(' ', '') # Remove spaces from list
     try:
       mod = __import__('printers.' + printname)
-      printer.append(eval('mod.' + printname + '.' + printname + '(config)'))
+      with trace.span('construct', plugin=printname):
+        printer.append(profiling.call(printname, '__init__',
+          eval('mod.' + printname + '.' + printname), config))
     except:
       sys.stderr.write('Error: Unable to load Printer \'%s\'.\n' % \
         (printname))
       sys.exit(1)
+  # Check printer timeouts now, rather than once the tests have run
+  for p in printer:
+    printerTimeout(p)
   
   # Load preloaders, setting test variables as required
   global loaders
   global testenv
   loadname = getConfig('core', 'preloaders').split(',')
+  loadclass = []
   for load in loadname:
     load = load.replace(' ', '') # Remove spaces from list
     try:
       mod = __import__('preloaders.' + load)
-      loaders.append(eval('mod.' + load + '.' + load + '(config, testenv)'))
+      loadclass.append((load, eval('mod.' + load + '.' + load)))
     except:
       sys.stderr.write('Error: Unable to load Preloader \'%s\'.\n' % \
         (load))
       sys.exit(1)
+  # Preloaders run at the same time (or in turn, while profiling), each with
+  # its own environment, which are then merged in the order the preloaders
+  # are listed
+  loadruns = []
+  loadstart = time.time()
+  for load, cls in loadclass:
+    run = {'env': {}}
+    def construct(load=load, cls=cls, run=run):
+      start = time.time()
+      try:
+        with trace.span('construct', plugin=load):
+          run['loader'] = profiling.call(load, '__init__', cls, config,
+            run['env'])
+      except:
+        pass
+      run['time'] = time.time() - start
+    thread = threading.Thread(target=construct)
+    thread.start()
+    if profiling.enabled():
+      thread.join()
+    loadruns.append((load, thread, run))
+  for load, thread, run in loadruns:
+    thread.join()
+    if 'loader' not in run:
+      sys.stderr.write('Error: Unable to load Preloader \'%s\'.\n' % \
+        (load))
+      sys.exit(1)
+    loaders.append(run['loader'])
+    testenv.update(run['env'])
+    if config.get('core', 'verbose') == '1':
+      sys.stderr.write('Info: Preloader \'%s\' took %.2f seconds.\n' % \
+        (load, run['time']))
+  trace.complete('preloaders', loadstart, time.time())
 
   # Print environment if verbose
   if config.get('core', 'verbose') == '1':
@@ -122,40 +343,69 @@ def main():
     print
 
   # Load previous run's tests for comparisons
-  lasttest = printer[0].loadLastTest()
+  with trace.span('loadLastTest', printer=printer[0].__class__.__name__):
+    lasttest = profiling.call(printer[0].__class__.__name__, 'loadLastTest',
+      printer[0].loadLastTest)
 
-  # Call upon tester to carry out its test
-  results = {}
-  try:
-    tester.execute(results, lasttest, testenv)
-  except:
-    sys.stderr.write('Error: Test execution failed.\n')
-    sys.exit(1)
+  # If the same sources have been tested before, reuse those results
+  results = None
+  cache = None
+  cachekey = None
+  if config.has_section('cache'):
+    cache = resultcache.resultcache(config)
+    cachekey = cache.getKey(testname, getattr(tester, '_CONFIGKEY', None),
+      testenv)
+    if cachekey:
+      with trace.span('cache.load'):
+        results = cache.load(cachekey, lasttest)
+    if results != None and config.get('core', 'verbose') == '1':
+      sys.stderr.write('Info: Using cached results, tests not run.\n')
 
-  # Pass test data to printer
-  for p in printer:
+  # Call upon tester to carry out its test
+  if results == None:
+    results = {}
     try:
-      p.storeResults(rundesc, results, testenv)
+      with trace.span('execute', plugin=testname):
+        profiling.call(testname, 'execute', tester.execute, results, lasttest,
+          testenv)
     except:
-      sys.stderr.write('Error: Printer Storage failed.\n')
+      sys.stderr.write('Error: Test execution failed.\n')
       sys.exit(1)
+    if cachekey:
+      with trace.span('cache.store'):
+        cache.store(cachekey, results)
+
+  # Pass test data to printers, reporting all failures together
+  with trace.span('printers'):
+    failures = storeResults(rundesc, results, testenv)
+  for p, reason in failures:
+    sys.stderr.write('Error: Printer Storage failed for \'%s\' (%s).\n' % \
+      (p.__class__.__name__, reason))
   
   # Finally tidy everything up
   # (If an exception is thrown, carry on)
   try:
-    tester.cleanup()
+    with trace.span('cleanup', plugin=testname):
+      profiling.call(testname, 'cleanup', tester.cleanup)
   except:
     sys.stderr.write('Warning: Tester cleanup failed.\n')
   for p in printer:
+    # Printers that timed out are still running, so are left alone
+    if (p, 'timed out') in failures:
+      continue
     try:
-      p.cleanup()
+      with trace.span('cleanup', plugin=p.__class__.__name__):
+        profiling.call(p.__class__.__name__, 'cleanup', p.cleanup)
     except:
       sys.stderr.write('Warning: Printer cleanup failed.\n')
   for loader in loaders:
     try:
-      loader.cleanup()
+      with trace.span('cleanup', plugin=loader.__class__.__name__):
+        profiling.call(loader.__class__.__name__, 'cleanup', loader.cleanup)
     except:
       sys.stderr.write('Warning: Preloader cleanup failed.\n')
+  if failures:
+    sys.exit(1)
 
 
 if __name__ == '__main__':
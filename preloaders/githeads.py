@@ -25,11 +25,24 @@
 ##
 ###############################################################################
 
-import os, subprocess, time, sys
+import json, os, subprocess, threading, time, sys
 
-""" Class for Git Information """
+""" Class for Git Information
+
+The head commit and whether there are uncommitted changes are found with a
+single 'git status --porcelain=v2 --branch', using git's untracked cache (and
+optionally its file system monitor) to avoid rescanning the whole worktree.
+Versions of git too old for this fall back to 'git log' and 'git status'.
+
+If a cache file is configured, the head commit of each directory is kept
+along with the modification times of its index, HEAD and current branch, and
+is reused while none of these change. Edits to files need not touch any of
+these, so whether there are uncommitted changes is always found, with a
+'git status' which does not look at the branch at all. """
 class githeads:
   _CONFIGKEY = 'load_githeads'
+  cachefile  = None
+  fsmonitor  = False
 
   """ Load module, setting test environment variables as required """
   def __init__(self, config, env):
@@ -46,6 +59,13 @@ class githeads:
     except:
       sys.stderr.write('Error: Invalid config for GitHeads Loader\n')
       sys.exit(1)
+    # Optional state cache and file system monitor
+    if config.has_option(self._CONFIGKEY, 'cache'):
+      self.cachefile = config.get(self._CONFIGKEY, 'cache')
+      if self.cachefile[0] != '/':
+        self.cachefile = startdir + '/' + self.cachefile
+    if config.has_option(self._CONFIGKEY, 'fsmonitor'):
+      self.fsmonitor = config.get(self._CONFIGKEY, 'fsmonitor') == '1'
     # Check that we have git in our path
     try:
       subprocess.Popen(['git', '--version'], stdout=subprocess.PIPE, \
@@ -53,48 +73,164 @@ class githeads:
     except:
       sys.stderr.write('Error: git not found in PATH.')
       sys.exit(1)
-    
-    # For each directory, attempt to find head commit
+
+    cache = {}
+    if self.cachefile != None and os.path.exists(self.cachefile):
+      try:
+        cache = json.load(file(self.cachefile))
+      except:
+        sys.stderr.write('Warning: Unable to read git state cache.\n')
+
+    # Find each directory's head commit at the same time, storing them in
+    # the environment in the order the directories are listed
+    heads = []
     for d in dirs:
       # If we start with a space, remove it
       while d[0] == ' ':
         d = d[1:]
+      # Change relative to fixed path
+      if d[0] != '/':
+        d = startdir + '/' + d
+      head = {}
+      thread = threading.Thread(target=self.findHead, args=(d, head, cache))
+      thread.start()
+      heads.append((thread, head))
+    newcache = {}
+    for thread, head in heads:
+      thread.join()
+      env.update(head.get('env', {}))
+      if 'cache' in head:
+        newcache[head['dir']] = head['cache']
+
+    if self.cachefile != None and newcache != cache:
       try:
-        # Change relative to fixed path and move to it
-        if d[0] != '/':
-          d = startdir + '/' + d
-        os.chdir(d)
-        p = subprocess.Popen(['git', 'log', '-1', '--pretty=format:%H'], \
-          stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        commit = p.stdout.read()
-        # If return code is not 0, raise exception to skip directory
-        if p.wait() != 0:
-          sys.stderr.write('Warning: Unable to process git in directory \'' \
-            + d + '\'. Error was:')
-          sys.stderr.write(commit)
-          raise ValueError
-        p = subprocess.Popen(['git', 'status', '--porcelain'], \
-          stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        status = p.stdout.read()
-        # If return code is not 0, raise exception to skip directory
-        if p.wait() != 0:
-          sys.stderr.write('Warning: Unable to process git in directory \'' \
-            + d + '\'. Error was:')
-          sys.stderr.write(status)
-          raise ValueError
-        # If status is non-blank (i.e. not clean commit, add an asterisk to
-        # the commit)
-        if status != '':
-          commit = commit + '*'
-        # Finally, store what we have learnt in the environment
-        # The following line may need removing in the future (or a new var)
-        d = d.split('/')[-1]
-        env['git_' + d] = commit
+        tmp = '%s.%i.tmp' % (self.cachefile, os.getpid())
+        json.dump(newcache, file(tmp, 'w'))
+        os.rename(tmp, self.cachefile)
       except:
-        # If we raise an exception, just move on. This case could be triggered 
-        # by asking for git information in a non-git directory
-        pass
-    os.chdir(startdir)
+        sys.stderr.write('Warning: Unable to store git state cache.\n')
+
+  """ Finds the head commit of a directory, storing the environment entry
+  for it in head, along with its entry for the state cache. """
+  def findHead(self, d, head, cache):
+    head['dir'] = d
+    try:
+      stamp = None
+      if self.cachefile != None:
+        stamp = self.getStamp(d)
+        if stamp != None and d in cache and cache[d].get('stamp') == stamp \
+            and 'head' in cache[d]:
+          dirty = self.isDirty(d)
+          if dirty != None:
+            commit = str(cache[d]['head'])
+            if dirty:
+              commit = commit + '*'
+            head['cache'] = cache[d]
+            head['env'] = {'git_' + d.split('/')[-1]: commit}
+            return
+      commit = self.statusHead(d)
+      if commit == None:
+        commit = self.logHead(d)
+      # Status may have refreshed the index, so take the stamp again
+      if stamp != None:
+        stamp = self.getStamp(d)
+        if stamp != None:
+          head['cache'] = {'stamp': stamp, 'head': commit.rstrip('*')}
+      # Finally, store what we have learnt in the environment
+      # The following line may need removing in the future (or a new var)
+      d = d.split('/')[-1]
+      head['env'] = {'git_' + d: commit}
+    except:
+      # If we raise an exception, just move on. This case could be triggered 
+      # by asking for git information in a non-git directory
+      pass
+
+  """ Returns the head commit of a directory, with an asterisk added if there
+  are uncommitted changes, using a single git status. Returns None if this
+  version of git does not support it (or the directory is not a git
+  repository). """
+  def statusHead(self, d):
+    p = subprocess.Popen(self.statusCmd(d) + ['--porcelain=v2', '--branch'],
+      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    status = p.communicate()[0]
+    if p.returncode != 0:
+      return None
+    commit = None
+    dirty = False
+    for line in status.split('\n'):
+      if line.startswith('# branch.oid '):
+        commit = line[len('# branch.oid '):]
+      elif line != '' and not line.startswith('#'):
+        dirty = True
+    # A repository with no commits has no head commit
+    if commit == None or commit == '(initial)':
+      raise ValueError
+    if dirty:
+      commit = commit + '*'
+    return commit
+
+  """ Returns whether a directory has uncommitted changes (including
+  untracked files), or None if this cannot be found. """
+  def isDirty(self, d):
+    p = subprocess.Popen(self.statusCmd(d) + ['--porcelain'],
+      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    status = p.communicate()[0]
+    if p.returncode != 0:
+      return None
+    return status != ''
+
+  """ Returns the 'git status' command for a directory, using the untracked
+  cache (and file system monitor, if enabled) to avoid scanning every file. """
+  def statusCmd(self, d):
+    cmd = ['git', '-C', d, '-c', 'core.untrackedCache=true']
+    if self.fsmonitor:
+      cmd += ['-c', 'core.fsmonitor=true']
+    return cmd + ['status']
+
+  """ Returns the head commit of a directory, with an asterisk added if there
+  are uncommitted changes, for versions of git without porcelain v2. """
+  def logHead(self, d):
+    p = subprocess.Popen(['git', 'log', '-1', '--pretty=format:%H'], \
+      stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=d)
+    commit = p.stdout.read()
+    # If return code is not 0, raise exception to skip directory
+    if p.wait() != 0:
+      sys.stderr.write('Warning: Unable to process git in directory \'' \
+        + d + '\'. Error was:')
+      sys.stderr.write(commit)
+      raise ValueError
+    p = subprocess.Popen(['git', 'status', '--porcelain'], \
+      stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=d)
+    status = p.stdout.read()
+    # If return code is not 0, raise exception to skip directory
+    if p.wait() != 0:
+      sys.stderr.write('Warning: Unable to process git in directory \'' \
+        + d + '\'. Error was:')
+      sys.stderr.write(status)
+      raise ValueError
+    # If status is non-blank (i.e. not clean commit, add an asterisk to
+    # the commit)
+    if status != '':
+      commit = commit + '*'
+    return commit
+
+  """ Returns the modification times of a directory's git index, HEAD and
+  current branch, or None if it does not have its own .git directory. """
+  def getStamp(self, d):
+    gitdir = d + '/.git'
+    if not os.path.isdir(gitdir):
+      return None
+    stamp = []
+    paths = ['index', 'HEAD', 'packed-refs']
+    ref = file(gitdir + '/HEAD').read().strip()
+    if ref.startswith('ref: '):
+      paths.append(ref[len('ref: '):])
+    for path in paths:
+      try:
+        stamp.append([path, os.stat(gitdir + '/' + path).st_mtime])
+      except OSError:
+        stamp.append([path, None])
+    return stamp
 
   """ Post-execution cleanup (if required). """
   def cleanup(self):
@@ -35,10 +35,13 @@ class stdenv:
     # Test time
     env['Test Date'] = time.strftime('%b %d, %Y %H:%M')
     # System information
-    env['Host Name'] = subprocess.Popen(['uname', '-n'], 
-      stdout=subprocess.PIPE).stdout.read()
-    env['Host Kernel'] = subprocess.Popen(['uname', '-sr'], 
-      stdout=subprocess.PIPE).stdout.read()
+    # (both are started before either is read, so they run together)
+    name = subprocess.Popen(['uname', '-n'], stdout=subprocess.PIPE)
+    kernel = subprocess.Popen(['uname', '-sr'], stdout=subprocess.PIPE)
+    env['Host Name'] = name.stdout.read()
+    env['Host Kernel'] = kernel.stdout.read()
+    name.wait()
+    kernel.wait()
 
   """ Post-execution cleanup (if required). """
   def cleanup(self):
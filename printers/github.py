@@ -26,7 +26,8 @@
 ##
 ###############################################################################
 
-import math, os, re, subprocess, sys
+import os, random, re, subprocess, sys, time
+from common import indexpages, render, sidecar, trace
 
 """ Class for storing results to GitHub """
 class github:
@@ -38,6 +39,19 @@ class github:
   key         = None
   wikidir     = None
   description = None
+  shallow     = False
+  backend     = 'worktree'
+  branch      = None
+  ident       = None
+  catfile     = None
+  fastimport  = None
+  indexrows   = 0
+  archiverows = 100
+  pushretries = 5
+  markup      = render.markdown()
+
+  """ Marks the end of streamed file contents given to git fast-import """
+  _DATA_END = 'MFRAMETEST-END-OF-PAGE'
 
   """ Default Wiki Index Page """
   _DEFAULT_INDEX = """This page contains the summary of test results for %s
@@ -99,9 +113,36 @@ tests can be found [[%s-Changed-%s|here]].
     self.description = self.getConfig('Description')
     if self.description == None:
       self.description = 'Unnamed Test Suite'
+    if self.getConfig('shallow') == '1':
+      self.shallow = True
+    try:
+      self.indexrows = int(self.getConfig('index_rows') or 0)
+      self.archiverows = int(self.getConfig('archive_rows') or 100)
+    except ValueError:
+      sys.stderr.write('Error: Invalid GitHub index pagination config.\n')
+      sys.exit(1)
+    try:
+      self.pushretries = int(self.getConfig('push_retries') or 5)
+    except ValueError:
+      sys.stderr.write('Error: Invalid GitHub push retry count.\n')
+      sys.exit(1)
+    backend = self.getConfig('backend')
+    if backend != None:
+      if backend not in ('worktree', 'plumbing'):
+        sys.stderr.write('Error: Unknown GitHub backend \'%s\'.\n' % backend)
+        sys.exit(1)
+      self.backend = backend
 
+    # The plumbing backend uses a bare repository with no checkout at all
+    start = time.time()
+    if self.backend == 'plumbing':
+      self.updateBare()
+    # In shallow mode, only the latest commit is fetched and only the files
+    # needed to find the previous results are checked out
+    elif self.shallow:
+      self.updateShallow()
     # If the wiki does not yet exist locally, clone it    
-    if not os.path.exists(self.wikidir):
+    elif not os.path.exists(self.wikidir):
       if self.verbose:
         sys.stderr.write('Info: Wiki Directory does not exist, cloning...\n')
       p = subprocess.Popen(['git', 'clone', self.remote, self.wikidir],
@@ -119,6 +160,273 @@ tests can be found [[%s-Changed-%s|here]].
         sys.stderr.write('Error: Unable to upate wiki\n')
         sys.exit(1)
       os.chdir(olddir)
+    trace.complete('github.update', start, time.time())
+
+  """ Clones or updates the wiki using a shallow, sparse checkout. The clone
+  holds only the latest commit, with file contents fetched on demand, and
+  only the index and the previous test's Passes page and sidecar are
+  checked out, so the time taken does not grow with the number of runs. """
+  def updateShallow(self):
+    devnull = file('/dev/null','wb')
+    if not os.path.exists(self.wikidir):
+      if self.verbose:
+        sys.stderr.write('Info: Wiki Directory does not exist, cloning...\n')
+      p = subprocess.Popen(['git', 'clone', '--depth', '1',
+        '--filter=blob:none', '--no-checkout', self.remote, self.wikidir],
+        stdout=devnull, stderr=subprocess.STDOUT)
+      if p.wait() != 0:
+        sys.stderr.write('Error: Unable to clone wiki\n')
+        sys.exit(1)
+    else:
+      p = subprocess.Popen(['git', 'fetch', '--depth', '1', 'origin'],
+        cwd=self.wikidir, stdout=devnull, stderr=subprocess.STDOUT)
+      if p.wait() != 0 or subprocess.Popen(['git', 'reset', '--soft', \
+        '@{upstream}'], cwd=self.wikidir, stdout=devnull, \
+        stderr=subprocess.STDOUT).wait() != 0:
+        sys.stderr.write('Error: Unable to upate wiki\n')
+        sys.exit(1)
+
+    # Read the index from the repository to find which files are needed. An
+    # empty wiki has no commits, and so nothing to check out.
+    if subprocess.Popen(['git', 'rev-parse', '--verify', '-q', 'HEAD'],
+      cwd=self.wikidir, stdout=devnull, stderr=devnull).wait() != 0:
+      return
+    def show(path):
+      p = subprocess.Popen(['git', 'show', 'HEAD:' + path], cwd=self.wikidir,
+        stdout=subprocess.PIPE, stderr=devnull)
+      contents = p.stdout.read()
+      if p.wait() != 0:
+        return None
+      return contents
+    p = subprocess.Popen(['git', 'sparse-checkout', 'set', '--no-cone'] + \
+      ['/' + path for path in self.sparsePaths(show)],
+      cwd=self.wikidir, stdout=devnull, stderr=subprocess.STDOUT)
+    if p.wait() != 0 or subprocess.Popen(['git', 'reset', '--hard', '-q'],
+      cwd=self.wikidir, stdout=devnull, stderr=subprocess.STDOUT).wait() != 0:
+      sys.stderr.write('Error: Unable to check out wiki\n')
+      sys.exit(1)
+
+  """ Clones or updates a bare copy of the wiki for the plumbing backend,
+  which reads and writes the repository without a working tree. """
+  def updateBare(self):
+    devnull = file('/dev/null','wb')
+    depth = []
+    if self.shallow:
+      depth = ['--depth', '1']
+    if not os.path.exists(self.wikidir):
+      if self.verbose:
+        sys.stderr.write('Info: Wiki Directory does not exist, cloning...\n')
+      filters = []
+      if self.shallow:
+        filters = ['--filter=blob:none']
+      p = subprocess.Popen(['git', 'clone', '--bare'] + depth + filters + \
+        [self.remote, self.wikidir], stdout=devnull, stderr=subprocess.STDOUT)
+      if p.wait() != 0:
+        sys.stderr.write('Error: Unable to clone wiki\n')
+        sys.exit(1)
+    p = subprocess.Popen(['git', 'symbolic-ref', 'HEAD'], cwd=self.wikidir,
+      stdout=subprocess.PIPE, stderr=devnull)
+    self.branch = p.stdout.read().strip()
+    if p.wait() != 0:
+      sys.stderr.write('Error: Unable to find wiki branch\n')
+      sys.exit(1)
+    # Fetch straight into the branch, as nothing is checked out. An empty
+    # wiki has nothing to fetch.
+    p = subprocess.Popen(['git', 'ls-remote', '--exit-code', 'origin',
+      self.branch], cwd=self.wikidir, stdout=devnull, stderr=devnull)
+    if p.wait() != 0:
+      return
+    p = subprocess.Popen(['git', 'fetch', '--update-head-ok'] + depth + \
+      ['origin', '+' + self.branch + ':' + self.branch], cwd=self.wikidir,
+      stdout=devnull, stderr=subprocess.STDOUT)
+    if p.wait() != 0:
+      sys.stderr.write('Error: Unable to upate wiki\n')
+      sys.exit(1)
+
+  """ Returns the contents of a file in the wiki, or None if it does not
+  exist. The plumbing backend reads the file from the branch through a
+  persistent 'git cat-file' process. """
+  def readFile(self, path):
+    if self.backend == 'worktree':
+      try:
+        return file(self.wikidir + '/' + path, 'rb').read()
+      except IOError:
+        return None
+    obj = self.catFile(self.branch + ':' + path)
+    if obj == None:
+      return None
+    return obj[1]
+
+  """ Returns the (sha1, contents) of a named object, or None if it does not
+  exist. """
+  def catFile(self, name):
+    if self.catfile == None:
+      self.catfile = subprocess.Popen(['git', 'cat-file', '--batch'],
+        cwd=self.wikidir, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    self.catfile.stdin.write(name + '\n')
+    self.catfile.stdin.flush()
+    header = self.catfile.stdout.readline().split()
+    if len(header) != 3:
+      return None
+    data = self.catfile.stdout.read(int(header[2]))
+    self.catfile.stdout.read(1)
+    return (header[0], data)
+
+  """ Writes a set of files, given as a list of (path, contents) tuples, to
+  the wiki as a single commit and pushes it. Contents are either a string or
+  a function returning the contents in chunks, which are written as they are
+  produced. Returns whether the push succeeded. """
+  def writeFiles(self, files, message):
+    with trace.span('github.commit', files=len(files)):
+      if self.backend == 'plumbing':
+        self.commitObjects(files, message)
+        pushcmd = ['git', 'push', 'origin', self.branch]
+      else:
+        self.commitWorktree(files, message)
+        pushcmd = ['git', 'push']
+    with trace.span('github.push'):
+      p = subprocess.Popen(pushcmd, cwd=self.wikidir,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+      out = p.stdout.read()
+      if self.verbose:
+        print out,
+      return p.wait() == 0
+
+  """ Replaces any local changes with the latest copy of the wiki, after a
+  rejected push. """
+  def refresh(self):
+    if self.backend == 'plumbing':
+      # Restart the reader, so nothing is read from the old branch
+      if self.catfile != None:
+        self.catfile.stdin.close()
+        self.catfile.wait()
+        self.catfile = None
+      self.updateBare()
+    elif self.shallow:
+      self.updateShallow()
+    else:
+      devnull = file('/dev/null','wb')
+      p = subprocess.Popen(['git', 'fetch', 'origin'], cwd=self.wikidir,
+        stdout=devnull, stderr=subprocess.STDOUT)
+      if p.wait() != 0 or subprocess.Popen(['git', 'reset', '--hard', '-q',
+        '@{upstream}'], cwd=self.wikidir, stdout=devnull,
+        stderr=subprocess.STDOUT).wait() != 0:
+        sys.stderr.write('Error: Unable to upate wiki\n')
+        sys.exit(1)
+
+  """ Commits files by writing them to the working tree and adding them. """
+  def commitWorktree(self, files, message):
+    paths = []
+    for path, contents in files:
+      if not os.path.exists(os.path.dirname(self.wikidir + '/' + path)):
+        os.makedirs(os.path.dirname(self.wikidir + '/' + path))
+      f = file(self.wikidir + '/' + path, 'wb')
+      if callable(contents):
+        for chunk in contents():
+          f.write(chunk)
+      else:
+        f.write(contents)
+      f.close()
+      paths.append(path)
+    # New pages are outside the sparse checkout, so must be added explicitly
+    if self.shallow:
+      addcmd = ['git', 'add', '--sparse']
+    else:
+      addcmd = ['git', 'add']
+    p = subprocess.Popen(addcmd + paths, cwd=self.wikidir,
+      stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    p = p.stdout.read()
+    if self.verbose:
+      print p,
+    p = subprocess.Popen(['git', 'commit', '-m', message], cwd=self.wikidir,
+      stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    p = p.stdout.read()
+    if self.verbose:
+      print p,
+
+  """ Commits files straight into the object database through a persistent
+  'git fast-import' process. The commit is built on the branch's current
+  tree, so only the given files change, and the branch is updated without
+  any checkout. """
+  def commitObjects(self, files, message):
+    if self.fastimport == None:
+      p = subprocess.Popen(['git', 'var', 'GIT_COMMITTER_IDENT'],
+        cwd=self.wikidir, stdout=subprocess.PIPE)
+      # Drop the timestamp, each commit is dated when it is made
+      self.ident = p.stdout.read().strip().rsplit(' ', 2)[0]
+      p.wait()
+      self.fastimport = subprocess.Popen(['git', 'fast-import', '--quiet',
+        '--date-format=now'], cwd=self.wikidir, stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE)
+    stream = ['commit %s\n' % self.branch,
+      'committer %s now\n' % self.ident,
+      'data %i\n%s\n' % (len(message), message)]
+    parent = self.catFile(self.branch)
+    if parent != None:
+      stream.append('from %s\n' % parent[0])
+    out = self.fastimport.stdin
+    out.write(''.join(stream))
+    for path, contents in files:
+      out.write('M 100644 inline %s\n' % path)
+      if callable(contents):
+        # The length is not known in advance, so the end is marked instead
+        out.write('data <<%s\n' % self._DATA_END)
+        last = '\n'
+        for chunk in contents():
+          if chunk != '':
+            out.write(chunk)
+            last = chunk[-1]
+        # The marker must start a line, and the newline before it is kept
+        # as part of the file, so contents which do not end in a newline
+        # have one added (unlike contents of known length, kept as given)
+        if last != '\n':
+          out.write('\n')
+        out.write('%s\n' % self._DATA_END)
+      else:
+        out.write('data %i\n' % len(contents))
+        out.write(contents)
+        out.write('\n')
+    # Wait for the branch to be updated before returning
+    out.write('\ncheckpoint\nprogress committed\n')
+    out.flush()
+    while True:
+      line = self.fastimport.stdout.readline()
+      if line == '':
+        sys.stderr.write('Error: Unable to commit to wiki\n')
+        sys.exit(1)
+      if line.strip() == 'progress committed':
+        break
+
+  """ Returns the paths in the wiki needed to load the previous results and
+  store new ones, given a function to read files from the wiki. """
+  def sparsePaths(self, show):
+    paths = [self.index + '.mediawiki']
+    if self.indexrows:
+      index = self.pagedIndex(show)
+      nextkey = index.nextKey()
+      paths.append(index.stateName() + '.mediawiki')
+      state = index.loadState()
+      if state != None and state[1]:
+        paths.append(index.archiveName(state[1] // self.archiverows + 1) + \
+          '.mediawiki')
+    else:
+      nextkey = re.search("<!-- ## NEXTKEY ([0-9]*) ## -->", show(paths[0]) \
+        or '')
+      if nextkey != None:
+        nextkey = nextkey.groups()[0]
+    if nextkey != None:
+      prevkey = str(int(nextkey) - 1)
+      paths.append(self.key + '/' + self.key + '-Passes-' + prevkey + '.dat')
+      paths.append(self.key + '/' + self.key + '-Passes-' + prevkey + '.md')
+    return paths
+
+  """ Returns the paginated index of the wiki, reading files with the given
+  function (by default, from the wiki). """
+  def pagedIndex(self, read=None):
+    if read == None:
+      read = self.readFile
+    return indexpages.pagedIndex(self.index, self.description, self.indexrows,
+      self.archiverows, lambda name: read(name + '.mediawiki'))
 
   """ Helper function to pull class-specific configuration variables """
   def getConfig(self, name):
@@ -132,192 +440,129 @@ tests can be found [[%s-Changed-%s|here]].
 
   """ If possible, returns the previous set of test results from the wiki. """
   def loadLastTest(self):
-    os.chdir(self.wikidir)
-    # If there is no index (i.e. first test), then return an empty set
-    if not os.path.exists(self.index + '.mediawiki'):
-      return {}
-
     # Find index number of previous test key, if invalid (or not exist),
     # return empty set
     try:
-      index = file(self.index + '.mediawiki').read()
-      nextkey = re.search("<!-- ## NEXTKEY ([0-9]*) ## -->", index)
-      if nextkey == None:
-        return {}
-      nextkey = nextkey.groups()[0]
+      if self.indexrows:
+        nextkey = self.pagedIndex().nextKey()
+        if nextkey == None:
+          return {}
+      else:
+        # If there is no index (i.e. first test), then return an empty set
+        index = self.readFile(self.index + '.mediawiki')
+        if index == None:
+          return {}
+        nextkey = re.search("<!-- ## NEXTKEY ([0-9]*) ## -->", index)
+        if nextkey == None:
+          return {}
+        nextkey = nextkey.groups()[0]
       prevkey = int(nextkey) - 1
-      if prevkey < 1 or not os.path.exists(self.key + '/' + self.key +
-        '-Passes-' + str(prevkey) + '.md'):
+      if prevkey < 1:
+        return {}
+      # Prefer the machine readable copy of the results, if stored
+      data = self.readFile(self.key + '/' + self.key + '-Passes-' + \
+        str(prevkey) + '.dat')
+      if data != None:
+        return sidecar.loads(data)
+      page = self.readFile(self.key + '/' + self.key + '-Passes-' + \
+        str(prevkey) + '.md')
+      if page == None:
         return {}
     except:
       return {}
     # Load and return set of previous results, if an exception occurs, just
     # return an empty set
     try:
-      results = {}
-      page = file(self.key + '/' + self.key + '-Passes-' + str(prevkey) + '.md')
-      page = page.read().split('\n')
-      for line in page:
-        # New test set
-        if line.startswith('## '):
-          test = {}
-          results[line[3:]] = test
-        elif line.startswith('### '):
-          testlist = []
-          if line == '### Unexpected Failures':
-            test['FAIL'] = testlist
-          elif line == '### Unexpected Passes':
-            test['XPASS'] = testlist
-        else:
-          testlist.append(line[4:])
+      results = self.markup.parsePassTable(page)
     except:
       return {}
     return results
 
-  """ Stores results to wiki. """
+  """ Stores results to wiki. If the push is rejected, because another run
+  updated the wiki first, the wiki is fetched again and the index update is
+  reapplied on top of it, taking the next free test key. This is retried,
+  waiting a little longer (with some randomness) each time. """
   def storeResults(self, rundesc, results, env):
-    os.chdir(self.wikidir)
-    # If the index page does not exist, attempt to create a new one
-    if not os.path.exists(self.index + '.mediawiki'):
-      sys.stderr.write('Warning: No index found, creating new.\n')
-      index = self._DEFAULT_INDEX % self.description
-    else:
-      index = file(self.index + '.mediawiki').read()
+    # Build the parts of the results pages which do not depend on the key.
+    # The pass and diff tables can be large, so are written out as they are
+    # generated, on every attempt, rather than held in memory.
+    doc = render.model(results, env)
+    indextable = self.markup.resultTable(doc, 2)
+    envtable  = self.markup.envTable(doc)
+    testtable = self.markup.resultTable(doc, 3)
+    passtable = lambda: self.markup.genPassTable(doc)
+    difftable = lambda: self.markup.genDiffTable(doc)
+    resultdata = sidecar.dumps(results)
 
-    # Find index number of next key, exit if unable to parse
-    nextkey = re.search("<!-- ## NEXTKEY ([0-9]*) ## -->", index)
-    if nextkey == None:
-      sys.stderr.write('Error: Unable to parse index.')
-      sys.exit(1)
-    nextkey = nextkey.groups()[0]
-
-    # Build testresult row
-    testtable = self.genResultTable(results, env, 2)
-    testrow = '<!-- ## NEXTROW ## -->\n|-\n !! '
-    testrow += '[[%s-Test-%s|Test %s]]<br>\'\'%s\'\'<br>\'\'%s\'\' || %s ' % \
-      (self.key, nextkey, nextkey, env['Test Date'], rundesc, testtable)
-
-    # Update index and next row key
-    index = index.replace('<!-- ## NEXTROW ## -->', testrow)
-    index = index.replace('<!-- ## NEXTKEY ' + nextkey + ' ## -->', \
-    '<!-- ## NEXTKEY ' + str(int(nextkey) + 1) + ' ## -->')
-
-    # Build results pages
-    envtable  = self.genEnvTable(env)
-    testtable = self.genResultTable(results, env, 3)
-    passtable = self.genPassTable(results)
-    difftable = self.genDiffTable(results)
-    testpage = self._DEFAULT_TESTPAGE % (self.key, int(nextkey)-1, self.key,
-      int(nextkey)+1, self.key, nextkey, self.key, nextkey,
-      envtable, testtable)
-
-    # Write, commit and push new pages, using the key as a directory
-    if not os.path.exists(self.key):
-      os.mkdir(self.key)
-    if self.verbose:
-      sys.stderr.write('Updating wiki\n')
-    file(self.index + '.mediawiki', 'w').write(index)
-    file(self.key + '/' + self.key + '-Test-' + nextkey + '.mediawiki', \
-      'w').write(testpage)
-    file(self.key + '/' + self.key + '-Passes-' + nextkey + '.md', \
-      'w').write(passtable)
-    file(self.key + '/' + self.key + '-Changed-' + nextkey + '.md', \
-      'w').write(difftable)
-    p = subprocess.Popen(['git', 'add', self.index + '.mediawiki', \
-      self.key + '/' + self.key + '-Test-' + nextkey + '.mediawiki',
-      self.key + '/' + self.key + '-Passes-' + nextkey + '.md',
-      self.key + '/' + self.key + '-Changed-' + nextkey + '.md'],
-      stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    p = p.stdout.read()
-    if self.verbose:
-      print p,
-    p = subprocess.Popen(['git', 'commit', '-m', 'Updated wiki for test ' + \
-      self.key + '-' + nextkey],
-      stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    p = p.stdout.read()
-    if self.verbose:
-      print p,
-    p = subprocess.Popen(['git', 'push'],
-      stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    p = p.stdout.read()
-    if self.verbose:
-      print p,
+    for attempt in xrange(self.pushretries + 1):
+      if attempt > 0:
+        delay = min(60, 2 ** attempt) * (0.5 + random.random())
+        sys.stderr.write('Warning: Unable to push to wiki, retrying in ' + \
+          '%.1f seconds.\n' % delay)
+        time.sleep(delay)
+        self.refresh()
+
+      if self.indexrows:
+        # The next key is kept with the paginated index
+        pages = self.pagedIndex()
+        nextkey = pages.nextKey()
+      else:
+        # If the index page does not exist, attempt to create a new one
+        index = self.readFile(self.index + '.mediawiki')
+        if index == None:
+          sys.stderr.write('Warning: No index found, creating new.\n')
+          index = self._DEFAULT_INDEX % self.description
+        # Find index number of next key
+        nextkey = re.search("<!-- ## NEXTKEY ([0-9]*) ## -->", index)
+        if nextkey != None:
+          nextkey = nextkey.groups()[0]
+      # Exit if unable to parse
+      if nextkey == None:
+        sys.stderr.write('Error: Unable to parse index.')
+        sys.exit(1)
+
+      # Build testresult row
+      testrow = '\n|-\n !! '
+      testrow += '[[%s-Test-%s|Test %s]]<br>\'\'%s\'\'<br>\'\'%s\'\' || %s ' \
+        % (self.key, nextkey, nextkey, env['Test Date'], rundesc, indextable)
+
+      # Update index and next row key
+      if self.indexrows:
+        indexfiles = [(name + '.mediawiki', text) for name, text in
+          pages.addRow(testrow)]
+      else:
+        index = index.replace('<!-- ## NEXTROW ## -->', \
+          '<!-- ## NEXTROW ## -->' + testrow)
+        index = index.replace('<!-- ## NEXTKEY ' + nextkey + ' ## -->', \
+        '<!-- ## NEXTKEY ' + str(int(nextkey) + 1) + ' ## -->')
+        indexfiles = [(self.index + '.mediawiki', index)]
+
+      # Build test page
+      testpage = self._DEFAULT_TESTPAGE % (self.key, int(nextkey)-1, self.key,
+        int(nextkey)+1, self.key, nextkey, self.key, nextkey,
+        envtable, testtable)
+
+      # Write, commit and push new pages, using the key as a directory
+      if self.verbose:
+        sys.stderr.write('Updating wiki\n')
+      page = self.key + '/' + self.key
+      if self.writeFiles(indexfiles + [
+        (page + '-Test-' + nextkey + '.mediawiki', testpage),
+        (page + '-Passes-' + nextkey + '.md', passtable),
+        (page + '-Changed-' + nextkey + '.md', difftable),
+        (page + '-Passes-' + nextkey + '.dat', resultdata)],
+        'Updated wiki for test ' + self.key + '-' + nextkey):
+        return
 
-  """ Builds table of newly broken/fixed tests. """
-  def genDiffTable(self, results):
-    table = ''
-    for dataset in sorted(results):
-      if 'testlist' in results[dataset].keys():
-        resultset = results[dataset]['testlist']
-        table += '## ' + dataset + '\n'
-        table += '### Newly Broken\n'
-        for test in resultset['NEWFAIL']:
-          table += '    ' + test + '\n'
-        table += '### Newly Fixed\n'
-        for test in resultset['NOTFAIL']:
-          table += '    ' + test + '\n'
-        table += '\n'        
-    return table    
-
-  """ Builds table of environment variables. """
-  def genEnvTable(self, env):
-    result = '{|'
-    for key in sorted(env):
-      result += '\n|-\n! ' + key + ' || ' + str(env[key])
-    result += '\n|}'
-    return result
-
-  """ Builds list of unexpected failures. """
-  def genPassTable(self, results):
-    table = ''
-    for dataset in sorted(results):
-      if 'testlist' in results[dataset].keys():
-        resultset = results[dataset]['testlist']
-        table += '## ' + dataset + '\n'
-        table += '### Unexpected Failures\n'
-        for test in resultset['FAIL']:
-          table += '    ' + test + '\n'
-        table += '### Unexpected Passes\n'
-        for test in resultset['XPASS']:
-          table += '    ' + test + '\n'
-        table += '\n'        
-    return table
-
-  """ Builds results table. """
-  def genResultTable(self, results, env, width):
-    colid = 0
-    testrow = '{|'
-    for dataset in sorted(results):
-      if colid == 0:
-        testrow += '\n|-'
-      resultset = results[dataset]['results']
-      testrow += self.resultFormat(dataset, resultset, env)
-      colid = (colid + 1) % width
-    testrow += '\n|}\n'
-    return testrow
-
-  """ Formats one set of summary results. """
-  def resultFormat(self, name, dataset, env):
-    # Calculate padding size
-    pad = int(math.ceil(math.log10(max(dataset))))
-    retval = '\n|| \'\'\'%s\'\'\'<pre>' % name
-    if dataset[0] > 0:
-      retval += '\n%s expected passes ' % str(dataset[0]).rjust(pad)
-    if dataset[1] > 0:
-      retval += '\n%s unexpected failures ' % str(dataset[1]).rjust(pad)
-    if dataset[2] > 0:
-      retval += '\n%s unexpected successes ' % str(dataset[2]).rjust(pad)
-    if dataset[3] > 0:
-      retval += '\n%s expected failures ' % str(dataset[3]).rjust(pad)
-    if dataset[4] > 0:
-      retval += '\n%s unresolved testcases  ' % str(dataset[4]).rjust(pad)
-    if dataset[5] > 0:
-      retval += '\n%s untested testcases ' % str(dataset[5]).rjust(pad)
-    if dataset[6] > 0:
-      retval += '\n%s unsupported tests ' % str(dataset[6]).rjust(pad)
-    retval += '</pre>'
-    return retval
+    sys.stderr.write('Error: Unable to push to wiki.\n')
+    sys.exit(1)
 
   """ Post-execution cleanup (if required). """
   def cleanup(self):
-    pass
+    # Finish any persistent git processes
+    for p in (self.fastimport, self.catfile):
+      if p != None:
+        p.stdin.close()
+        p.wait()
+    self.fastimport = None
+    self.catfile = None
@@ -0,0 +1,287 @@
+###### history.py - Run History Printer #######################################
+##
+##                                  MFrameTest
+##
+##  Copyright (C) 2012-2013 Embecosm Limited
+##
+##  This file is part of MFrameTest.
+##
+##  MFrameTest is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  MFrameTest is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with MFrameTest. If not, see <http://www.gnu.org/licenses/>.
+##
+###############################################################################
+##
+##  Class for storing results in a local SQLite database
+##
+###############################################################################
+
+import os, sqlite3, sys, time
+from common import regdiff
+
+""" Class for storing the history of every run in a local database.
+
+Each run is stored under the configured key, so several test configurations
+can share one database. Test and set names are stored once each in their own
+tables, and each run only holds the summary counts of every set and the ids
+of its FAIL and XPASS tests, in the order they were found. Indexes on
+(key, run) and (test, run) keep finding the latest run and the history of a
+single test fast however many runs are stored.
+
+Each change in a test's state from one run to the next (starting to fail or
+pass unexpectedly, or no longer doing so) is also stored as a transition, so
+when a test broke and how often it has flipped since can be found from a few
+rows, without reading every run. """
+class history:
+  _CONFIGKEY = 'print_history'
+  config     = None
+  verbose    = False
+  database   = None
+  key        = None
+  db         = None
+
+  """ Database Schema Version (kept as the user_version), raised when
+  existing databases need updating """
+  _VERSION = 1
+
+  """ Database Schema """
+  _SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+  id          INTEGER PRIMARY KEY,
+  key         TEXT NOT NULL,
+  time        REAL NOT NULL,
+  description TEXT);
+CREATE INDEX IF NOT EXISTS runs_key ON runs (key, id);
+CREATE TABLE IF NOT EXISTS env (
+  run         INTEGER NOT NULL REFERENCES runs (id),
+  name        TEXT NOT NULL,
+  value       TEXT,
+  PRIMARY KEY (run, name));
+CREATE TABLE IF NOT EXISTS sections (
+  id          INTEGER PRIMARY KEY,
+  name        TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS counts (
+  run         INTEGER NOT NULL REFERENCES runs (id),
+  section     INTEGER NOT NULL REFERENCES sections (id),
+  pass        INTEGER NOT NULL,
+  fail        INTEGER NOT NULL,
+  xpass       INTEGER NOT NULL,
+  xfail       INTEGER NOT NULL,
+  unresolved  INTEGER NOT NULL,
+  untested    INTEGER NOT NULL,
+  unsupported INTEGER NOT NULL,
+  PRIMARY KEY (run, section));
+CREATE TABLE IF NOT EXISTS tests (
+  id          INTEGER PRIMARY KEY,
+  name        TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS results (
+  run         INTEGER NOT NULL REFERENCES runs (id),
+  section     INTEGER NOT NULL REFERENCES sections (id),
+  kind        INTEGER NOT NULL,
+  test        INTEGER NOT NULL REFERENCES tests (id));
+CREATE INDEX IF NOT EXISTS results_run ON results (run);
+CREATE INDEX IF NOT EXISTS results_test ON results (test, run);
+CREATE TABLE IF NOT EXISTS transitions (
+  key         TEXT NOT NULL,
+  section     INTEGER NOT NULL REFERENCES sections (id),
+  test        INTEGER NOT NULL REFERENCES tests (id),
+  run         INTEGER NOT NULL REFERENCES runs (id),
+  kind        INTEGER);
+CREATE INDEX IF NOT EXISTS transitions_test ON transitions (test, key, run);
+"""
+
+  """ Class Constructor. Loads and parses configuration. """
+  def __init__(self, config):
+    # Load config and set variables
+    self.config = config
+    try:
+      if config.get('core', 'verbose') == '1':
+        self.verbose = True
+    except:
+      pass
+
+    # If we don't have a printer specific config section, raise error
+    if not self._CONFIGKEY in config._sections:
+      sys.stderr.write('Error: Config for History Printer not found. Is ' + \
+        'this the correct printer?\n')
+      sys.exit(1)
+
+    # Load config
+    self.database = self.getConfig('database')
+    if self.database == None:
+      sys.stderr.write('Error: History config is missing database.\n')
+      sys.exit(1)
+    if self.database[0] != '/':
+      self.database = os.getcwd() + '/' + self.database
+    self.key = self.getConfig('key')
+    if self.key == None:
+      sys.stderr.write('Error: History config is missing test key.\n')
+      sys.exit(1)
+
+    # Open the database, creating it if needed. Printers are called from
+    # more than one thread, though never at the same time.
+    try:
+      self.db = sqlite3.connect(self.database, check_same_thread=False)
+      self.db.text_factory = str
+      self.db.execute('PRAGMA journal_mode = WAL')
+      self.db.execute('PRAGMA synchronous = NORMAL')
+      self.db.executescript(self._SCHEMA)
+      # Databases from before transitions were stored need them adding,
+      # which is only done once, as many databases never have any
+      if self.db.execute('PRAGMA user_version').fetchone()[0] < 1:
+        if self.db.execute('SELECT 1 FROM transitions').fetchone() == None:
+          self.addAllTransitions()
+        self.db.execute('PRAGMA user_version = %i' % self._VERSION)
+    except sqlite3.Error, e:
+      sys.stderr.write('Error: Unable to open history database (%s).\n' % e)
+      sys.exit(1)
+
+  """ Helper function to pull class-specific configuration variables """
+  def getConfig(self, name):
+    if not self.config:
+      sys.stderr.write('Error: Tried to load config with no config loaded')
+      sys.exit(1)
+    try:
+      return self.config.get(self._CONFIGKEY, name)
+    except:
+      return None
+
+  """ Returns the id of the latest run stored under the key, or None. """
+  def lastRun(self):
+    row = self.db.execute('SELECT MAX(id) FROM runs WHERE key = ?',
+      (self.key,)).fetchone()
+    return row[0]
+
+  """ Returns the id of the run before the given run under the same key, or
+  None. """
+  def previousRun(self, run):
+    row = self.db.execute('SELECT MAX(p.id) FROM runs r JOIN runs p ON ' + \
+      'p.key = r.key AND p.id < r.id WHERE r.id = ?', (run,)).fetchone()
+    return row[0]
+
+  """ Returns a run's failing tests, as a dictionary from (section, test) to
+  kind. """
+  def runKinds(self, run):
+    kinds = {}
+    if run != None:
+      for section, test, kind in self.db.execute('SELECT section, test, ' + \
+          'kind FROM results WHERE run = ?', (run,)):
+        kinds[(section, test)] = kind
+    return kinds
+
+  """ Stores the transitions between the previous run (if any) and a run. A
+  kind of None means that a test stopped failing. """
+  def addTransitions(self, key, run, prevrun):
+    old = self.runKinds(prevrun)
+    new = self.runKinds(run)
+    changes = []
+    for test in new:
+      if old.get(test) != new[test]:
+        changes.append((key, test[0], test[1], run, new[test]))
+    for test in old:
+      if test not in new:
+        changes.append((key, test[0], test[1], run, None))
+    self.db.executemany('INSERT INTO transitions VALUES (?, ?, ?, ?, ?)',
+      changes)
+
+  """ Stores the transitions of every run, for a database without any. """
+  def addAllTransitions(self):
+    with self.db:
+      prevruns = {}
+      for run, key in self.db.execute('SELECT id, key FROM runs ' + \
+          'ORDER BY id').fetchall():
+        self.addTransitions(key, run, prevruns.get(key))
+        prevruns[key] = run
+
+  """ Returns the transitions of a test under the key, as a list of (set
+  name, run, kind name or None, run time, run description) tuples ordered by
+  set name then run. """
+  def flips(self, test):
+    flips = []
+    for section, run, kind, runtime, desc in self.db.execute('SELECT ' + \
+        's.name, r.id, x.kind, r.time, r.description FROM tests t ' + \
+        'JOIN transitions x ON x.test = t.id AND x.key = ? ' + \
+        'JOIN sections s ON s.id = x.section JOIN runs r ON r.id = x.run ' + \
+        'WHERE t.name = ? ORDER BY s.name, x.run', (self.key, test)):
+      if kind != None:
+        kind = regdiff.KINDS[kind]
+      flips.append((section, run, kind, runtime, desc))
+    return flips
+
+  """ Returns the environment of a run, as a dictionary. """
+  def runEnv(self, run):
+    return dict(self.db.execute('SELECT name, value FROM env WHERE run = ?',
+      (run,)))
+
+  """ Returns the id of a name in a name table, adding it if needed. """
+  def intern(self, table, name, ids):
+    if name not in ids:
+      row = self.db.execute('SELECT id FROM %s WHERE name = ?' % table,
+        (name,)).fetchone()
+      if row == None:
+        ids[name] = self.db.execute('INSERT INTO %s (name) VALUES (?)' % \
+          table, (name,)).lastrowid
+      else:
+        ids[name] = row[0]
+    return ids[name]
+
+  """ Returns the previous set of test results from the database. """
+  def loadLastTest(self):
+    try:
+      run = self.lastRun()
+      if run == None:
+        return {}
+      results = {}
+      for name, in self.db.execute('SELECT s.name FROM counts c ' + \
+          'JOIN sections s ON s.id = c.section WHERE c.run = ?', (run,)):
+        results[name] = {}
+        for kind in regdiff.KINDS:
+          results[name][kind] = []
+      for section, kind, test in self.db.execute('SELECT s.name, r.kind, ' + \
+          't.name FROM results r JOIN sections s ON s.id = r.section ' + \
+          'JOIN tests t ON t.id = r.test WHERE r.run = ? ORDER BY r.rowid',
+          (run,)):
+        results[section][regdiff.KINDS[kind]].append(test)
+    except sqlite3.Error:
+      return {}
+    return results
+
+  """ Stores results in the database as a new run. """
+  def storeResults(self, rundesc, results, env):
+    if self.verbose:
+      sys.stderr.write('Updating history database\n')
+    # The whole run is stored in a single transaction
+    with self.db:
+      prevrun = self.lastRun()
+      run = self.db.execute('INSERT INTO runs (key, time, description) ' + \
+        'VALUES (?, ?, ?)', (self.key, time.time(), rundesc)).lastrowid
+      self.db.executemany('INSERT INTO env (run, name, value) ' + \
+        'VALUES (?, ?, ?)', [(run, name, str(env[name])) for name in env])
+      sections = {}
+      tests = {}
+      for name in sorted(results):
+        section = self.intern('sections', name, sections)
+        self.db.execute('INSERT INTO counts VALUES (?, ?, ?, ?, ?, ?, ?, ' + \
+          '?, ?)', [run, section] + list(results[name]['results']))
+        testlist = results[name].get('testlist', {})
+        for kind in xrange(len(regdiff.KINDS)):
+          self.db.executemany('INSERT INTO results (run, section, kind, ' + \
+            'test) VALUES (?, ?, ?, ?)', [(run, section, kind,
+            self.intern('tests', test, tests)) for test in \
+            testlist.get(regdiff.KINDS[kind], ())])
+      self.addTransitions(self.key, run, prevrun)
+
+  """ Post-execution cleanup (if required). """
+  def cleanup(self):
+    if self.db != None:
+      self.db.close()
+      self.db = None
@@ -26,12 +26,16 @@
 ##
 ###############################################################################
 
-import math, os, re, subprocess, sys
+import os, re, subprocess, sys
 import pygtk, pynotify
+from common import render
 
 """ Class for printing results to libnotify popups """
 class libnotify:
-  
+  # GTK calls must not be made from other threads, so run on the main thread
+  serial = True
+  markup = render.notification()
+
   """ Class Constructor. . """
   def __init__(self, config):
     # Set up pygtk and pynotify
@@ -46,11 +50,9 @@ class libnotify:
 
   """ Prints results to output """
   def storeResults(self, rundesc, results, env):
-    for dataset in sorted(results):
-      resultset = results[dataset]['results']
-      resultset = self.resultFormat(dataset, resultset, env)
-      notification = pynotify.Notification('Test Complete: ' + dataset, 
-        resultset)
+    doc = render.model(results, env)
+    for title, text in self.markup.summaries(doc):
+      notification = pynotify.Notification(title, text)
       try:
         if not notification.show():
           sys.stderr.write('Warning: Unable to use libnotify notification.\n')
@@ -59,26 +61,6 @@ class libnotify:
         sys.stderr.write('Warning: Unable to send libnotify notification.\n')
         return
 
-  """ Formats one set of summary results. """
-  def resultFormat(self, name, dataset, env):
-    # Calculate padding size
-    retval = 'Results: ' 
-    if dataset[0] > 0:
-      retval += '%i expected passes. ' % dataset[0]
-    if dataset[1] > 0:
-      retval += '%i unexpected failures. ' % dataset[1]
-    if dataset[2] > 0:
-      retval += '%i unexpected successes. ' % dataset[2]
-    if dataset[3] > 0:
-      retval += '%i expected failures. ' % dataset[3]
-    if dataset[4] > 0:
-      retval += '%i unresolved testcases.  ' % dataset[4]
-    if dataset[5] > 0:
-      retval += '%i untested testcases. ' % dataset[5]
-    if dataset[6] > 0:
-      retval += '%i unsupported tests. ' % dataset[6]
-    return retval
-
   """ Post-execution cleanup (if required). """
   def cleanup(self):
     pass
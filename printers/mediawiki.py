@@ -28,8 +28,9 @@
 ##
 ###############################################################################
 
-import math, re, sys
-import mwclient
+import calendar, inspect, random, re, sys, threading, time
+import mwclient, mwclient.errors
+from common import indexpages, render, trace
 
 """ Class for storing results to MediaWiki """
 class mediawiki:
@@ -43,6 +44,16 @@ class mediawiki:
   password    = None
   wikiURL     = None
   site        = None
+  indexrows   = 0
+  archiverows = 100
+  saveretries = 5
+  claimtimeout = 600
+  maxpagebytes = 1048576
+  markup      = render.wikitext()
+  cache       = None
+  token       = None
+  starttime   = None
+  servertime  = None
 
   """ Default Wiki Index Page """
   _DEFAULT_INDEX = """This page contains the summary of test results for %s
@@ -51,6 +62,15 @@ class mediawiki:
 |}
 <!-- ## NEXTKEY 1 ## --> """
 
+  """ Most requests made to the wiki at once """
+  _PARALLEL = 8
+
+  """ Page of Test Lists Split Into Parts """
+  _PARTS_PAGE = """<!-- ## PARTS %i ## -->
+This list is too large for a single page, so is split into %i parts:
+%s
+"""
+
   """ Default Test Page """
   _DEFAULT_TESTPAGE = """
 __NOTOC__
@@ -108,12 +128,42 @@ tests can be found [[%s-Changed-%s|here]].
     if not self.wikiURL.startswith('http://'):
       sys.stderr.write('Error: mwclient only supports http://\n')
       sys.exit(1)
+    try:
+      self.indexrows = int(self.getConfig('index_rows') or 0)
+      self.archiverows = int(self.getConfig('archive_rows') or 100)
+    except ValueError:
+      sys.stderr.write('Error: Invalid MediaWiki index pagination config.\n')
+      sys.exit(1)
+    try:
+      self.saveretries = int(self.getConfig('save_retries') or 5)
+    except ValueError:
+      sys.stderr.write('Error: Invalid MediaWiki save retry count.\n')
+      sys.exit(1)
+    try:
+      self.claimtimeout = int(self.getConfig('claim_timeout') or 600)
+    except ValueError:
+      sys.stderr.write('Error: Invalid MediaWiki claim timeout.\n')
+      sys.exit(1)
+    try:
+      self.maxpagebytes = int(self.getConfig('max_page_bytes') or 1048576)
+    except ValueError:
+      sys.stderr.write('Error: Invalid MediaWiki page size limit.\n')
+      sys.exit(1)
+
+    # Pages read this session, by name, as a dictionary with the text,
+    # revision id and timestamp of each (or None if it does not exist)
+    self.cache = {}
 
     # Try to connect
     url = self.wikiURL.split('/', 3)
     print url
-    self.site = mwclient.Site(url[2], path='/'+url[3])
-    self.site.login(username=self.username, password=self.password)
+    with trace.span('mediawiki.login'):
+      # Newer mwclient takes the scheme separately, and uses https by default
+      if 'scheme' in inspect.getargspec(mwclient.Site.__init__)[0]:
+        self.site = mwclient.Site(url[2], path='/'+url[3], scheme='http')
+      else:
+        self.site = mwclient.Site(('http', url[2]), path='/'+url[3])
+      self.site.login(username=self.username, password=self.password)
 
   """ Helper function to pull class-specific configuration variables """
   def getConfig(self, name):
@@ -125,167 +175,347 @@ tests can be found [[%s-Changed-%s|here]].
     except:
       return None
 
+  """ Fetches the latest revision of each of a list of pages with a single
+  query, adding them to the page cache (with None for pages which do not
+  exist). With redirects, redirect pages are followed and the page they lead
+  to cached under its own name. The edit token is fetched with the first
+  query. """
+  def fetchPages(self, names, redirects=False):
+    args = {'prop': 'revisions', 'rvprop': 'ids|timestamp|content',
+      'rvslots': 'main', 'titles': '|'.join(names), 'curtimestamp': '1'}
+    if redirects:
+      args['redirects'] = '1'
+    if self.token == None:
+      args['meta'] = 'tokens'
+    with trace.span('mediawiki.fetch', pages=len(names)):
+      result = self.site.api('query', **args)
+    query = result.get('query', {})
+    if 'tokens' in query:
+      self.token = query['tokens']['csrftoken']
+    if self.starttime == None:
+      self.starttime = result.get('curtimestamp')
+    self.servertime = result.get('curtimestamp')
+    # Titles may be normalized (e.g. with a capital first letter), so are
+    # mapped back to the names asked for
+    aliases = {}
+    for alias in query.get('normalized', []):
+      aliases.setdefault(alias['to'], []).append(alias['from'])
+    for page in query.get('pages', {}).values():
+      entry = None
+      if 'missing' not in page and 'invalid' not in page and \
+          page.get('revisions'):
+        rev = page['revisions'][0]
+        # Pages are kept as UTF-8, like the results they are compared with
+        text = rev.get('slots', {}).get('main', rev).get('*', '')
+        entry = {'text': text.encode('utf-8'), 'revid': rev['revid'],
+          'timestamp': rev['timestamp']}
+      for name in [page['title']] + aliases.get(page['title'], []):
+        self.cache[name] = entry
+    # Anything not returned (e.g. a redirect which was followed) is treated
+    # as missing, rather than fetched again
+    for name in names:
+      self.cache.setdefault(name, None)
+
+  """ Returns the text of a page, or None if it does not exist. Pages are
+  read from the page cache, fetching them if needed. """
+  def readPage(self, name):
+    if name not in self.cache:
+      self.fetchPages([name])
+    page = self.cache[name]
+    if page == None or page['text'] == '':
+      return None
+    return page['text']
+
+  """ Returns the age in seconds of a page's latest revision, by the wiki's
+  clock when the page was last read, or None if the page was not found. """
+  def pageAge(self, name):
+    page = self.cache.get(name)
+    if page == None or self.servertime == None:
+      return None
+    parse = lambda stamp: calendar.timegm(time.strptime(stamp,
+      '%Y-%m-%dT%H:%M:%SZ'))
+    return parse(self.servertime) - parse(page['timestamp'])
+
+  """ Saves a page, returning whether it was saved. A page which was read
+  is only saved over the revision that was read, and any other page only
+  created, so an edit made meanwhile (e.g. by another run) is reported
+  rather than overwritten. If force is set, the page is saved regardless. """
+  def savePage(self, name, text, summary, force=False):
+    args = {}
+    page = self.cache.get(name)
+    if force:
+      pass
+    elif page != None:
+      args = {'basetimestamp': page['timestamp'], 'baserevid': page['revid'],
+        'nocreate': '1'}
+      if self.starttime != None:
+        args['starttimestamp'] = self.starttime
+    else:
+      args = {'createonly': '1'}
+    try:
+      with trace.span('mediawiki.save', page=name):
+        result = self.site.api('edit', title=name, text=text,
+          summary=summary, token=self.token, **args)
+    except mwclient.errors.APIError, e:
+      if e.code in ('editconflict', 'articleexists', 'missingtitle'):
+        return False
+      raise
+    result = result.get('edit', {})
+    if result.get('result') != 'Success':
+      sys.stderr.write('Error: Unable to save wiki page \'%s\'.\n' % name)
+      sys.exit(1)
+    # Keep pages which were read up to date, for any later save
+    if page != None and 'nochange' not in result:
+      self.cache[name] = {'text': text, 'revid': result['newrevid'],
+        'timestamp': result['newtimestamp']}
+    return True
+
+  """ Runs each of a list of functions on its own thread, no more than
+  _PARALLEL at a time, waiting for them all to finish. An exception raised by
+  any of them is raised again here. """
+  def runAll(self, jobs):
+    errors = []
+    def run(job):
+      try:
+        job()
+      except:
+        errors.append(sys.exc_info())
+    for start in xrange(0, len(jobs), self._PARALLEL):
+      threads = [threading.Thread(target=run, args=(job,))
+        for job in jobs[start:start + self._PARALLEL]]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+    if errors:
+      raise errors[0][0], errors[0][1], errors[0][2]
+
+  """ Returns the names of the parts of a split page. """
+  def partNames(self, name, parts):
+    return ['%s/%i' % (name, part) for part in xrange(1, parts + 1)]
+
+  """ Returns the text of a page of test lists, or None if it does not
+  exist. If the page was split into parts, they are fetched at the same time
+  and joined back together, a line apiece. """
+  def readLists(self, name):
+    page = self.readPage(name)
+    if page == None:
+      return None
+    parts = re.match('<!-- ## PARTS ([0-9]+) ## -->', page)
+    if parts == None:
+      return page
+    names = self.partNames(name, int(parts.groups()[0]))
+    self.runAll([lambda part=part: self.fetchPages([part]) for part in names])
+    # Parts are only needed once, so are not kept in the page cache
+    texts = [self.readPage(part) for part in names]
+    for part in names:
+      del self.cache[part]
+    if None in texts:
+      return None
+    # The wiki strips the newline ending each part, so it is put back
+    return '\n'.join([text.rstrip('\n') for text in texts])
+
+  """ Creates a page of test lists, given as a generator of chunks ending at
+  line boundaries. A page over the size limit is split between numbered
+  parts (<name>/1, <name>/2, ...) of no more than the limit, where possible,
+  which are created at the same time, and the page itself lists the parts.
+  Returns whether every page was created. """
+  def saveLists(self, name, chunks, summary):
+    parts = []
+    buf = []
+    size = 0
+    for chunk in chunks:
+      if size + len(chunk) > self.maxpagebytes and size > 0:
+        parts.append(''.join(buf))
+        buf = []
+        size = 0
+      buf.append(chunk)
+      size += len(chunk)
+    if not parts:
+      return self.savePage(name, ''.join(buf), summary)
+    parts.append(''.join(buf))
+    names = self.partNames(name, len(parts))
+    saved = []
+    self.runAll([lambda part=part, text=text:
+      saved.append(self.savePage(part, text, summary))
+      for part, text in zip(names, parts)])
+    # Only link to the parts once they exist
+    toc = '\n'.join(['* [[%s|Part %i]]' % (names[i], i + 1)
+      for i in xrange(len(names))])
+    return all(saved) and self.savePage(name,
+      self._PARTS_PAGE % (len(parts), len(parts), toc), summary)
+
+  """ Returns the paginated index of the wiki. """
+  def pagedIndex(self):
+    return indexpages.pagedIndex(self.index, self.description, self.indexrows,
+      self.archiverows, self.readPage)
+
+  """ Returns the pages needed to find the next test key and update the
+  index. """
+  def indexPages(self):
+    if self.indexrows:
+      return [self.index, self.pagedIndex().stateName()]
+    return [self.index]
+
+  """ Returns the next test key from the index, or None if it cannot be
+  parsed. """
+  def nextKey(self):
+    if self.indexrows:
+      return self.pagedIndex().nextKey()
+    index = self.readPage(self.index)
+    if index == None:
+      index = self._DEFAULT_INDEX % self.description
+    nextkey = re.search("<!-- ## NEXTKEY ([0-9]*) ## -->", index)
+    if nextkey == None:
+      return None
+    return nextkey.groups()[0]
+
   """ If possible, returns the previous set of test results from the wiki. """
   def loadLastTest(self):
-    # If there is no index (i.e. first test), then return an empty set
-    index = self.site.pages[self.index].edit()
-    if index == '':
-      return {}
-
     # Find index number of previous test key, if invalid (or not exist),
-    # return empty set
+    # return empty set. The previous pass page is read with the index,
+    # through the redirect to the latest one.
     try:
-      nextkey = re.search("<!-- ## NEXTKEY ([0-9]*) ## -->", index)
+      self.fetchPages(self.indexPages() + [self.key + '-Passes-Latest'],
+        redirects=True)
+      # If there is no index (i.e. first test), then return an empty set
+      if not self.indexrows and self.readPage(self.index) == None:
+        return {}
+      nextkey = self.nextKey()
       if nextkey == None:
         return {}
-      nextkey = nextkey.groups()[0]
       prevkey = int(nextkey) - 1
-      page = self.site.pages[self.key + '-Passes-' + str(prevkey)].edit()
-      if page == '':
+      if prevkey < 1:
+        return {}
+      # If the redirect led elsewhere (or is missing), this is read now
+      page = self.readLists(self.key + '-Passes-' + str(prevkey))
+      if page == None:
         return {}
     # Load and return set of previous results, if an exception occurs, just
     # return an empty set
-      results = {}
-      page = page.split('\n')
-      for line in page:
-        # New test set
-        if line.startswith('== '):
-          test = {}
-          results[line[3:-3]] = test
-        elif line.startswith('=== '):
-          testlist = []
-          if line == '=== Unexpected Failures ===':
-            test['FAIL'] = testlist
-          elif line == '=== Unexpected Passes ===':
-            test['XPASS'] = testlist
-        else:
-          testlist.append(line[4:])
+      results = self.markup.parsePassTable(page)
     except:
       return {}
     return results
 
-  """ Stores results to wiki. """
+  """ Stores results to wiki. The next test key is claimed by creating its
+  test page, which fails if another run has created it first, in which case
+  the index is read again and the next free key tried, waiting a little
+  longer (with some randomness) each time. A key whose test page is older
+  than the claim timeout while the index still points at it was left by a
+  run which died before updating the index, so is skipped. Once claimed, the
+  index and the pass and diff pages are saved at the same time. """
   def storeResults(self, rundesc, results, env):
-    # If the index page does not exist, attempt to create a new one
-    if self.site.pages[self.index].edit() == '':
-      sys.stderr.write('Warning: No index found, creating new.\n')
-      index = self._DEFAULT_INDEX % self.description
-    else:
-      index = self.site.pages[self.index].edit()
+    doc = render.model(results, env)
+    indextable = self.markup.resultTable(doc, 2)
+    envtable  = self.markup.envTable(doc)
+    testtable = self.markup.resultTable(doc, 3)
 
-    # Find index number of next key, exit if unable to parse
-    nextkey = re.search("<!-- ## NEXTKEY ([0-9]*) ## -->", index)
-    if nextkey == None:
-      sys.stderr.write('Error: Unable to parse index.')
+    if self.verbose:
+      sys.stderr.write('Updating wiki\n')
+    takenkey = None
+    for attempt in xrange(self.saveretries + 1):
+      if attempt > 0:
+        delay = min(60, 2 ** attempt) * (0.5 + random.random())
+        sys.stderr.write('Warning: Test key taken by another run, ' + \
+          'retrying in %.1f seconds.\n' % delay)
+        time.sleep(delay)
+        self.cache = {}
+      # Pages already read by loadLastTest are not read again
+      missing = [name for name in self.indexPages() if name not in self.cache]
+      # The test page of a key that was taken is read with the index, to find
+      # how long ago it was claimed
+      if takenkey != None:
+        missing.append(self.key + '-Test-' + takenkey)
+      if missing:
+        self.fetchPages(missing)
+      nextkey = self.nextKey()
+      # Exit if unable to parse
+      if nextkey == None:
+        sys.stderr.write('Error: Unable to parse index.')
+        sys.exit(1)
+      if takenkey != None:
+        # The taken key's test page is dropped once its age is known, so
+        # claims still only ever create test pages
+        takenpage = self.key + '-Test-' + takenkey
+        age = self.pageAge(takenpage)
+        self.cache.pop(takenpage, None)
+        if int(takenkey) >= int(nextkey) and age != None and \
+            age >= self.claimtimeout:
+          sys.stderr.write('Warning: Skipping test key %s, claimed %i ' \
+            'seconds ago by a run which did not finish.\n' % (takenkey, age))
+          nextkey = str(int(takenkey) + 1)
+
+      # Build test page
+      testpage = self._DEFAULT_TESTPAGE % (self.key, int(nextkey)-1, self.key,
+        int(nextkey)+1, self.key, nextkey, self.key, nextkey,
+        envtable, testtable)
+      logmessage = 'Updated wiki for test ' + self.key + '-' + nextkey
+      if self.savePage(self.key + '-Test-' + nextkey, testpage, logmessage):
+        break
+      takenkey = nextkey
+    else:
+      sys.stderr.write('Error: Unable to claim a test key on the wiki.\n')
       sys.exit(1)
-    nextkey = nextkey.groups()[0]
 
     # Build testresult row
-    testtable = self.genResultTable(results, env, 2)
-    testrow = '<!-- ## NEXTROW ## -->\n|-\n ! '
+    testrow = '\n|-\n ! '
     testrow += '[[%s-Test-%s|Test %s]]<br>\'\'%s\'\'<br>\'\'%s\'\' || %s ' % \
-      (self.key, nextkey, nextkey, env['Test Date'], rundesc, testtable)
-
-    # Update index and next row key
-    index = index.replace('<!-- ## NEXTROW ## -->', testrow)
-    index = index.replace('<!-- ## NEXTKEY ' + nextkey + ' ## -->', \
-    '<!-- ## NEXTKEY ' + str(int(nextkey) + 1) + ' ## -->')
-
-    # Build results pages
-    envtable  = self.genEnvTable(env)
-    testtable = self.genResultTable(results, env, 3)
-    passtable = self.genPassTable(results)
-    difftable = self.genDiffTable(results)
-    testpage = self._DEFAULT_TESTPAGE % (self.key, int(nextkey)-1, self.key,
-      int(nextkey)+1, self.key, nextkey, self.key, nextkey,
-      envtable, testtable)
-
-    # Write, commit and push new pages, using the key as a directory
-    if self.verbose:
-      sys.stderr.write('Updating wiki\n')
-    logmessage = 'Updated wiki for test ' + self.key + '-' + nextkey
-    self.site.pages[self.index].save(text=index, summary=logmessage)
-    self.site.pages[self.key + '-Test-' + nextkey].save(text=testpage, \
-      summary=logmessage)
-    self.site.pages[self.key + '-Passes-' + nextkey].save(text=passtable, \
-      summary=logmessage)
-    self.site.pages[self.key + '-Changed-' + nextkey].save(text=difftable, \
-      summary=logmessage)
-
-  """ Builds table of newly broken/fixed tests. """
-  def genDiffTable(self, results):
-    table = ''
-    for dataset in sorted(results):
-      if 'testlist' in results[dataset].keys():
-        resultset = results[dataset]['testlist']
-        table += '== ' + dataset + ' ==\n'
-        table += '=== Newly Broken ===\n'
-        for test in resultset['NEWFAIL']:
-          table += '    ' + test + '\n'
-        table += '=== Newly Fixed ===\n'
-        for test in resultset['NOTFAIL']:
-          table += '    ' + test + '\n'
-        table += '\n'        
-    return table    
-
-  """ Builds table of environment variables. """
-  def genEnvTable(self, env):
-    result = '{|'
-    for key in sorted(env):
-      result += '\n|-\n! ' + key + ' || ' + str(env[key])
-    result += '\n|}'
-    return result
-
-  """ Builds list of unexpected failures. """
-  def genPassTable(self, results):
-    table = ''
-    for dataset in sorted(results):
-      if 'testlist' in results[dataset].keys():
-        resultset = results[dataset]['testlist']
-        table += '== ' + dataset + ' ==\n'
-        table += '=== Unexpected Failures ===\n'
-        for test in resultset['FAIL']:
-          table += '    ' + test + '\n'
-        table += '=== Unexpected Passes ===\n'
-        for test in resultset['XPASS']:
-          table += '    ' + test + '\n'
-        table += '\n'        
-    return table
-
-  """ Builds results table. """
-  def genResultTable(self, results, env, width):
-    colid = 0
-    testrow = '\n{|'
-    for dataset in sorted(results):
-      if colid == 0:
-        testrow += '\n|-'
-      resultset = results[dataset]['results']
-      testrow += self.resultFormat(dataset, resultset, env)
-      colid = (colid + 1) % width
-    testrow += '\n|}\n'
-    return testrow
-
-  """ Formats one set of summary results. """
-  def resultFormat(self, name, dataset, env):
-    # Calculate padding size
-    pad = int(math.ceil(math.log10(max(dataset))))
-    retval = '\n|| \'\'\'%s\'\'\'<pre>' % name
-    if dataset[0] > 0:
-      retval += '\n%s expected passes ' % str(dataset[0]).rjust(pad)
-    if dataset[1] > 0:
-      retval += '\n%s unexpected failures ' % str(dataset[1]).rjust(pad)
-    if dataset[2] > 0:
-      retval += '\n%s unexpected successes ' % str(dataset[2]).rjust(pad)
-    if dataset[3] > 0:
-      retval += '\n%s expected failures ' % str(dataset[3]).rjust(pad)
-    if dataset[4] > 0:
-      retval += '\n%s unresolved testcases  ' % str(dataset[4]).rjust(pad)
-    if dataset[5] > 0:
-      retval += '\n%s untested testcases ' % str(dataset[5]).rjust(pad)
-    if dataset[6] > 0:
-      retval += '\n%s unsupported tests ' % str(dataset[6]).rjust(pad)
-    retval += '</pre>'
-    return retval
+      (self.key, nextkey, nextkey, env['Test Date'], rundesc, indextable)
+
+    # The pass and diff tables can be large, so each is only gathered into
+    # buffers as it is uploaded, and split into parts if too large for a
+    # single page. The redirect to the latest pass page lets the next run
+    # read it with the index.
+    passes = self.key + '-Passes-' + nextkey
+    def saveNew(name, gen):
+      if not self.saveLists(name, gen(doc), logmessage):
+        sys.stderr.write('Warning: Page \'%s\' already exists.\n' % name)
+    self.runAll([lambda: self.updateIndex(nextkey, testrow, logmessage),
+      lambda: saveNew(passes, self.markup.genPassTable),
+      lambda: saveNew(self.key + '-Changed-' + nextkey,
+        self.markup.genDiffTable),
+      lambda: self.savePage(self.key + '-Passes-Latest',
+        '#REDIRECT [[%s]]' % passes, logmessage, force=True)])
+
+  """ Adds a row to the index for a claimed test key, moving the index's
+  next key past it. The index may be behind the claimed key (if an unfinished
+  run's key was skipped) or ahead of it (if this run was slow enough for
+  another to skip its key), so only the later of the two is kept. A conflict
+  means the index was edited meanwhile, in which case it is read and updated
+  again. """
+  def updateIndex(self, nextkey, testrow, logmessage):
+    for attempt in xrange(self.saveretries + 1):
+      if attempt > 0:
+        sys.stderr.write('Warning: Index edited while updating, retrying.\n')
+        for name in self.indexPages() + [name for name, text in updates]:
+          self.cache.pop(name, None)
+      indexkey = self.nextKey()
+      if indexkey == None:
+        sys.stderr.write('Error: Unable to parse index.\n')
+        sys.exit(1)
+      if self.indexrows:
+        updates = self.pagedIndex().addRow(testrow, nextkey)
+      else:
+        index = self.readPage(self.index)
+        if index == None:
+          sys.stderr.write('Warning: No index found, creating new.\n')
+          index = self._DEFAULT_INDEX % self.description
+        index = index.replace('<!-- ## NEXTROW ## -->', \
+          '<!-- ## NEXTROW ## -->' + testrow)
+        index = index.replace('<!-- ## NEXTKEY ' + indexkey + ' ## -->', \
+        '<!-- ## NEXTKEY ' + str(max(int(indexkey), int(nextkey) + 1)) + \
+          ' ## -->')
+        updates = [(self.index, index)]
+      # Pages are saved in order, so archive pages exist before the index
+      # links to them
+      for name, text in updates:
+        if not self.savePage(name, text, logmessage):
+          break
+      else:
+        return
+    sys.stderr.write('Error: Unable to update wiki index.\n')
+    sys.exit(1)
 
   """ Post-execution cleanup (if required). """
   def cleanup(self):
@@ -25,12 +25,39 @@
 ##
 ###############################################################################
 
-import os, re, subprocess, sys
+import collections, glob, heapq, json, mmap, multiprocessing, os, re
+import subprocess, sys, time
+from common import outcomes, profiling, regdiff, resultmodel, trace
+
+# Number of output lines kept for reporting a failed test
+_OUTPUT_TAIL = 200
+
+# Lines of a summary file that are passed to the output parser
+_SUMMARY_LINE = re.compile('^(?:[ \t]*===.*|# of .*|FAIL: .*|XPASS: .*)$', \
+  re.M)
+
+# Lines of a summary file that are passed to the parser when capturing the
+# outcome of every test
+_CAPTURE_LINE = re.compile('^(?:[ \t]*===.*|# of .*|[A-Z]+: .*)$', re.M)
 
 """ Class for DejaGnu Testing
 
-Tests are 4-tuples with the following format:
-(prefix, directory, command, site.exp) """
+Tests are 7-tuples with the following format:
+(prefix, directory, command, site.exp, summary files, shards, .exp files)
+If summary files (a list of glob patterns for .sum or .log files) are given,
+results are read from those files rather than from the command output, and
+the command, if any, is only run to produce them.
+If more than one shard is given, the .exp files (a list of glob patterns)
+are split between that many runs of the command, which run at the same time
+with their own output and temporary directories, and the results of each are
+summed. The shards still share the test directory and the site.exp in it, so
+the command must not rewrite site.exp while they run (automake's site.exp
+rule only does so when the Makefile has changed).
+
+If capture_dir is set, the outcome of every test is recorded, not just the
+counts and FAIL/XPASS names. Each run's outcomes are stored in that
+directory (see common/outcomes.py) and compared against the previous run's,
+with the tests whose outcome changed added to each set's CHANGED list. """
 class dejagnu:
   _CONFIGKEY = 'test_dejagnu'
   config  = None
@@ -39,6 +66,10 @@ class dejagnu:
   numtests = 0
   siteexp = None
   tests = []
+  maxparallel = 1
+  exptimes = None
+  expdurations = {}
+  capturedir = None
 
   """ Function for reading Configuration Information """
   def getConfig(self, name):
@@ -72,6 +103,28 @@ class dejagnu:
     if self.numtests < 1:
       sys.stderr.write('Error: Invalid number of tests.\n')
       sys.exit(1)
+    maxparallel = self.getConfig('max_parallel')
+    if maxparallel:
+      try:
+        self.maxparallel = int(maxparallel)
+      except ValueError:
+        sys.stderr.write('Error: Invalid maximum number of parallel ' + \
+          'tests.\n')
+        sys.exit(1)
+    # Durations of .exp files from previous runs, used to balance shards
+    self.exptimes = self.getConfig('exptimes')
+    self.expdurations = {}
+    if self.exptimes:
+      if self.exptimes[0] != '/':
+        self.exptimes = os.getcwd() + '/' + self.exptimes
+      try:
+        self.expdurations = json.load(open(self.exptimes))
+      except:
+        pass
+    # Directory to store the outcome of every test in, if capturing
+    self.capturedir = self.getConfig('capture_dir')
+    if self.capturedir and self.capturedir[0] != '/':
+      self.capturedir = os.getcwd() + '/' + self.capturedir
     for i in range(1, self.numtests + 1):
       testdir = self.getConfig('test_%i_dir' % i)
       if not testdir:
@@ -79,7 +132,14 @@ class dejagnu:
       if testdir[0] != '/':
         testdir = os.getcwd() + '/' + testdir
       testcmd = self.getConfig('test_%i_cmd' % i)
-      if not testcmd:
+      testsums = self.getConfig('test_%i_sum' % i)
+      if testsums:
+        testsums = [x.strip() for x in testsums.split(',')]
+        for j in xrange(len(testsums)):
+          if testsums[j][0] != '/':
+            testsums[j] = os.getcwd() + '/' + testsums[j]
+        testsums = tuple(testsums)
+      if not testcmd and not testsums:
         sys.stderr.write('Error: Test %i has no run command.\n' % i)
         sys.exit(1)
       testsite = self.getConfig('test_%i_site' % i)
@@ -90,12 +150,37 @@ class dejagnu:
       testprefix = self.getConfig('test_%i_pre' % i)
       if not testprefix:
         testprefix = ''
-      self.tests.append((testprefix, testdir, testcmd, testsite))
+      testshards = self.getConfig('test_%i_shards' % i)
+      try:
+        testshards = int(testshards or 1)
+      except ValueError:
+        sys.stderr.write('Error: Test %i has an invalid shard count.\n' % i)
+        sys.exit(1)
+      testexps = self.getConfig('test_%i_exps' % i)
+      if testexps:
+        testexps = [x.strip() for x in testexps.split(',')]
+        for j in xrange(len(testexps)):
+          if testexps[j][0] != '/':
+            testexps[j] = os.getcwd() + '/' + testexps[j]
+        testexps = tuple(testexps)
+      if testshards > 1 and not testexps:
+        sys.stderr.write('Error: Test %i is sharded but has no .exp ' % i + \
+          'files.\n')
+        sys.exit(1)
+      self.tests.append((testprefix, testdir, testcmd, testsite, testsums,
+        testshards, testexps))
+
+    # Sharded tests run at the same time unless told otherwise
+    if not maxparallel:
+      self.maxparallel = max([test[5] for test in self.tests])
 
     # Print config if verbose
     if self.verbose:
       print 'Global site.exp file:   ', self.siteexp
       print 'Number of DejaGnu tests:', self.numtests
+      print 'Maximum parallel tests: ', self.maxparallel
+      if self.capturedir:
+        print 'Capturing outcomes to:  ', self.capturedir
       print 'Tests:'
       for i in xrange(self.numtests):
         print '  Test %i' % (i+1)
@@ -103,130 +188,432 @@ class dejagnu:
         print '    Test Directory:', self.tests[i][1]
         print '    Test Command:  ', self.tests[i][2]
         print '    Test Site:     ', self.tests[i][3]
+        if self.tests[i][4]:
+          print '    Test Summaries:', ', '.join(self.tests[i][4])
+        if self.tests[i][5] > 1:
+          print '    Test Shards:   ', self.tests[i][5]
       print
 
   """ Execute the tests that were loaded in the configuration """
   def execute(self, results, lasttest, testenv):
+    # Build the list of runs, one per test or one per shard of a test
+    capture = self.capturedir != None
+    jobs = []
     for test in self.tests:
-      # Clear output log for error handling
-      out = ''
-      if self.verbose:
-        print 'Executing DejaGnu test \'%s\' with prefix \'%s\'' % \
-          (test[2], test[0])
-      try:
-        # Move to directory and configure build environment
-        os.chdir(test[1])
-        os.environ['DEJAGNU'] = test[3]
-        if test[3] == None or test[3] == 'None':
-          # If dejagnu variable should not be set, remove it
-          os.environ.pop('DEJAGNU')
-        # Run test and log output
-        # FIXME: Add a more "shell friendly" split system
-        p = subprocess.Popen(test[2].split(' '), stdout=subprocess.PIPE, \
-          stderr=subprocess.STDOUT)
-        out = p.stdout.read()
-
-        # Parse output log
-        out = out.split('\n')
-        curtest = None
-        # pass, xfail, xpass, fail, unresolved, untested, unsupport
-        result = [0, 0, 0, 0, 0, 0, 0]
-        # FAIL, XPASS
-        testlist = {'FAIL': [], 'XPASS': []}
-        for line in out:
-          newtest = re.match('\s*=== (.*) tests ===\s*?', line)
-          # If we have a new test, save previous result if any
-          if newtest:
-            if curtest:
-              # If we have previous results, create list of changed tests
-              # otherwise all tests are new
-              if curtest in lasttest:
-                # Newly failed tests
-                testlist['NEWFAIL'] = []
-                for t in testlist['FAIL']:
-                  if t not in lasttest[curtest]['FAIL']:
-                    testlist['NEWFAIL'].append(t)
-                for t in testlist['XPASS']:
-                  if t not in lasttest[curtest]['XPASS']:
-                    testlist['NEWFAIL'].append(t)
-                # Newly fixed tests
-                testlist['NOTFAIL'] = []
-                for t in lasttest[curtest]['FAIL']:
-                  if t not in testlist['FAIL']:
-                    testlist['NOTFAIL'].append(t)
-                for t in lasttest[curtest]['XPASS']:
-                  if t not in testlist['XPASS']:
-                    testlist['NOTFAIL'].append(t)
-              else:
-                testlist['NEWFAIL'] = testlist['FAIL'] + testlist['XPASS']
-                testlist['NOTFAIL'] = []
-              # Store results
-              results[curtest] = {'results': result, 'testlist': testlist}
-              if self.verbose:
-                print curtest, result
-            # Calculate new test name
-            if test[0] != None and test[0] != 'None':
-              curtest = test[0] + newtest.groups()[0]
-            else:
-              curtest = newtest.groups()[0]
-            result = [0, 0, 0, 0, 0, 0, 0]
-            testlist = {'FAIL': [], 'XPASS': []}
-
-          elif 'of expected passes' in line:
-            result[0] = int(line.replace('# of expected passes',''))
-          elif 'of unexpected failures' in line:
-            result[1] = int(line.replace('# of unexpected failures',''))
-          elif 'of unexpected successes' in line:
-            result[2] = int(line.replace('# of unexpected successes',''))
-          elif 'of expected failures' in line:
-            result[3] = int(line.replace('# of expected failures',''))
-          elif 'of unresolved testcases' in line:
-            result[4] = int(line.replace('# of unresolved testcases',''))
-          elif 'of untested testcases' in line:
-            result[5] = int(line.replace('# of untested testcases',''))
-          elif 'of unsupported tests' in line:
-            result[6] = int(line.replace('# of unsupported tests',''))
-          elif line[:6] == 'FAIL: ':
-            testlist['FAIL'].append(line[6:])
-          elif line[:7] == 'XPASS: ':
-            testlist['XPASS'].append(line[7:])
-
-        # Finished processing file, process last set of results
-        if curtest:
-          # If we have previous results, create list of changed tests
-          # otherwise all tests are new
-          if curtest in lasttest:
-            # Newly failed tests
-            testlist['NEWFAIL'] = []
-            for t in testlist['FAIL']:
-              if t not in lasttest[curtest]['FAIL']:
-                testlist['NEWFAIL'].append(t)
-            for t in testlist['XPASS']:
-              if t not in lasttest[curtest]['XPASS']:
-                testlist['NEWFAIL'].append(t)
-            # Newly fixed tests
-            testlist['NOTFAIL'] = []
-            for t in lasttest[curtest]['FAIL']:
-              if t not in testlist['FAIL']:
-                testlist['NOTFAIL'].append(t)
-            for t in lasttest[curtest]['XPASS']:
-              if t not in testlist['XPASS']:
-                testlist['NOTFAIL'].append(t)
-          else:
-            testlist['NEWFAIL'] = testlist['FAIL'] + testlist['XPASS']
-            testlist['NOTFAIL'] = []
-          # Store results
-          results[curtest] = {'results': result, 'testlist': testlist}
+      if not test[2]:
+        continue
+      if test[5] > 1:
+        shards = self.shardExps(test)
+        if shards == []:
+          sys.stderr.write('Error: No .exp files found for sharded test ' + \
+            'with prefix \'%s\'\n' % test[0])
+          sys.exit(1)
+        for i in xrange(len(shards)):
           if self.verbose:
-            print curtest, result
+            print 'Executing DejaGnu test \'%s\' with prefix \'%s\' ' \
+              '(shard %i of %i)' % (test[2], test[0], i+1, len(shards))
+          jobs.append((test, (test[1] + '/mframetest-shard-%i' % (i+1),
+            shards[i]), capture))
+      else:
+        if self.verbose:
+          print 'Executing DejaGnu test \'%s\' with prefix \'%s\'' % \
+            (test[2], test[0])
+        jobs.append((test, None, capture))
+
+    # Run each job, either in turn or across a pool of worker processes.
+    # Results are returned in job order, so merging them below gives the
+    # same output regardless of how many jobs ran at once. While profiling,
+    # jobs are run in turn so that parsing is included in the profile.
+    if self.maxparallel > 1 and len(jobs) > 1 and not profiling.enabled():
+      pool = multiprocessing.Pool(min(self.maxparallel, len(jobs)))
+      try:
+        runs = pool.map(_runTest, jobs)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      runs = map(_runTest, jobs)
+    testruns = {}
+    for job, run in zip(jobs, runs):
+      testruns.setdefault(job[0], []).append(run)
+      # Runs are timed where they ran, so are added to the trace here
+      if run[3] != None and trace.enabled():
+        pid, start, end, spans = run[3]
+        trace.complete('test', start, end, tid=pid, prefix=job[0][0],
+          cmd=job[0][2])
+        for curtest, start, end in spans:
+          trace.complete('section', start, end, tid=pid, set=curtest)
+
+    # Outcomes of the previous run, to find tests whose outcome has changed
+    if capture:
+      lastoutcomes = self.loadOutcomes()
+      newoutcomes = {}
+
+    # Merge the sections from each test into the results, storing each test
+    # name once for the whole run
+    table = resultmodel.nametable()
+    for test in self.tests:
+      shardsections = []
+      for sections, out, durations, timing in testruns.get(test, []):
+        if sections == None:
+          sys.stderr.write('Error: Failed to execute test with prefix ' + \
+            '\'%s\'\n' % test[0])
+          sys.stderr.write('Output was (if any):\n')
+          sys.stderr.write(out)
+          sys.stderr.write('\n')
+          sys.exit(1)
+        shardsections.append(sections)
+        self.expdurations.setdefault(test[1] + ':' + test[2], {}).update( \
+          durations)
+      if test[4]:
+        with trace.span('readSummaries', prefix=test[0]):
+          sections = self.readSummaries(test)
+      elif len(shardsections) == 1:
+        sections = shardsections[0]
+      else:
+        sections = _mergeSections(shardsections)
+      for curtest, result, testlist in sections:
+        regdiff.annotate(curtest, testlist, lasttest)
+        if capture:
+          # Sets that were not captured before have nothing to compare with
+          newoutcomes[curtest] = outcomes.columns(*testlist.pop('OUTCOMES'))
+          changes = []
+          if curtest in lastoutcomes:
+            changes = outcomes.compare(lastoutcomes[curtest],
+              newoutcomes[curtest])
+          testlist['CHANGED'] = [outcomes.describe(c) for c in changes]
+        # Store results
+        results[curtest] = resultmodel.section(table, result, testlist)
+        if self.verbose:
+          print curtest, result
+
+    if capture:
+      self.storeOutcomes(newoutcomes)
+
+    # Store .exp durations for balancing future runs
+    if self.exptimes:
+      try:
+        json.dump(self.expdurations, open(self.exptimes, 'w'), indent=1, \
+          sort_keys=True)
       except:
-        sys.stderr.write('Error: Failed to execute test with prefix \'%s\'\n' \
-          % test[0])
-        sys.stderr.write('Output was (if any):\n')
-        sys.stderr.write(out)
-        sys.stderr.write('\n')
-        sys.exit(1)
-    
+        sys.stderr.write('Warning: Unable to store .exp durations.\n')
+
+  """ Returns the outcomes stored by the previous run, if any. """
+  def loadOutcomes(self):
+    path = self.capturedir + '/latest.outcomes'
+    if not os.path.exists(path):
+      return {}
+    try:
+      return outcomes.loads(open(path, 'rb').read())
+    except:
+      sys.stderr.write('Warning: Unable to read previous test outcomes.\n')
+      return {}
+
+  """ Stores this run's outcomes, keeping the previous run's as well. """
+  def storeOutcomes(self, sets):
+    path = self.capturedir + '/latest.outcomes'
+    try:
+      if not os.path.exists(self.capturedir):
+        os.makedirs(self.capturedir)
+      tmp = '%s.%i.tmp' % (path, os.getpid())
+      open(tmp, 'wb').write(outcomes.dumps(sets))
+      if os.path.exists(path):
+        os.rename(path, self.capturedir + '/previous.outcomes')
+      os.rename(tmp, path)
+    except:
+      sys.stderr.write('Warning: Unable to store test outcomes.\n')
+
+  """ Splits the .exp files of a test into balanced lists, one per shard.
+  Each .exp file, longest first, is given to the shard with the least work,
+  using durations from previous runs where known and the average duration
+  otherwise. .exp files are named without their directory, as RUNTESTFLAGS
+  expects, so files of the same name always run together. """
+  def shardExps(self, test):
+    exps = set()
+    for pattern in test[6]:
+      exps.update([os.path.basename(f) for f in glob.glob(pattern)])
+    known = self.expdurations.get(test[1] + ':' + test[2], {})
+    times = [known[exp] for exp in exps if exp in known]
+    if times:
+      default = sum(times) / len(times)
+    else:
+      default = 1.0
+    exps = sorted(exps, key=lambda exp: (-known.get(exp, default), exp))
+    shards = [(0.0, i, []) for i in xrange(min(test[5], len(exps)))]
+    for exp in exps:
+      load, i, shard = heapq.heappop(shards)
+      shard.append(exp)
+      heapq.heappush(shards, (load + known.get(exp, default), i, shard))
+    return [sorted(shard) for load, i, shard in sorted(shards, \
+      key=lambda x: x[1])]
+
+  """ Reads the sets of results for a test from its summary files. Files
+  are mapped into memory and scanned for results lines, with many files being
+  scanned in parallel. Sets of results are returned in file order, with sets
+  of the same name from several files (e.g. a tool's .sum files from more
+  than one build) merged into one. """
+  def readSummaries(self, test):
+    files = []
+    for pattern in test[4]:
+      files += sorted(glob.glob(pattern))
+    if files == []:
+      sys.stderr.write('Error: No summary files found for test with ' + \
+        'prefix \'%s\'\n' % test[0])
+      sys.exit(1)
+    if self.verbose:
+      print 'Reading %i DejaGnu summary files with prefix \'%s\'' % \
+        (len(files), test[0])
+    jobs = [(f, test[0], self.capturedir != None) for f in files]
+    try:
+      if len(jobs) > 1 and not profiling.enabled():
+        pool = multiprocessing.Pool(min(multiprocessing.cpu_count(), \
+          len(jobs)))
+        try:
+          scans = pool.map(_scanSummary, jobs)
+        finally:
+          pool.close()
+          pool.join()
+      else:
+        scans = map(_scanSummary, jobs)
+    except:
+      sys.stderr.write('Error: Failed to read summaries for test with ' + \
+        'prefix \'%s\'\n' % test[0])
+      sys.exit(1)
+    if len(scans) == 1:
+      return scans[0]
+    return _mergeSections(scans)
 
   def cleanup(self):
-    pass
\ No newline at end of file
+    pass
+
+""" Runs a single test, given as a (test, shard, capture) tuple, returning a
+tuple of the parsed sections, the test output, the time taken by each .exp
+file and a (process id, start, end, section times) tuple for the trace. This
+is a module level function so that it can be handed to a multiprocessing
+pool; the working directory and DEJAGNU value are passed to the child process
+rather than set on this process. The output is parsed as it is written, so
+only the most recent lines are kept for error reporting. On failure, the
+sections are None and those lines are returned.
+
+If shard is given, it is an (output directory, .exp files) tuple that is
+added to RUNTESTFLAGS, so only those .exp files are run, with their output
+and temporary files kept in that directory. """
+def _runTest(job):
+  test, shard, capture = job
+  # Clear output log for error handling
+  out = collections.deque(maxlen=_OUTPUT_TAIL)
+  start = time.time()
+  try:
+    # Configure build environment
+    env = dict(os.environ)
+    if test[3] == None or test[3] == 'None':
+      # If dejagnu variable should not be set, remove it
+      env.pop('DEJAGNU', None)
+    else:
+      env['DEJAGNU'] = test[3]
+    # FIXME: Add a more "shell friendly" split system
+    cmd = test[2].split(' ')
+    if shard:
+      # Variables given to runtest override those set by site.exp
+      tmpdir = shard[0] + '/tmp'
+      if not os.path.exists(tmpdir):
+        os.makedirs(tmpdir)
+      flags = '--outdir ' + shard[0] + ' tmpdir=' + tmpdir + ' ' + \
+        ' '.join(shard[1])
+      for i in xrange(len(cmd)):
+        if cmd[i].startswith('RUNTESTFLAGS='):
+          cmd[i] += ' ' + flags
+          break
+      else:
+        cmd.append('RUNTESTFLAGS=' + flags)
+    # Run test and parse output as it arrives
+    p = subprocess.Popen(cmd, cwd=test[1], env=env, \
+      stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    parser = outputParser(test[0], capture)
+    for line in iter(p.stdout.readline, ''):
+      out.append(line)
+      # Results of tests with summary files are read from those instead
+      if not test[4]:
+        parser.feed(line.rstrip('\n'))
+    p.wait()
+    sections = parser.finish()
+    return (sections, None, parser.durations, (os.getpid(), start, \
+      time.time(), parser.spans))
+  except:
+    return (None, ''.join(out), {}, None)
+
+""" Merges the sets of results from several shards or summary files of a
+test, given as a list of lists of sections. Sets with the same name are
+combined by summing their counts and joining their FAIL and XPASS lists (and
+captured outcomes) in order. """
+def _mergeSections(shardsections):
+  merged = []
+  byname = {}
+  for sections in shardsections:
+    for curtest, result, testlist in sections:
+      if curtest not in byname:
+        byname[curtest] = (curtest, list(result),
+          {'FAIL': list(testlist['FAIL']), 'XPASS': list(testlist['XPASS'])})
+        if 'OUTCOMES' in testlist:
+          names, codes = testlist['OUTCOMES']
+          byname[curtest][2]['OUTCOMES'] = (list(names), bytearray(codes))
+        merged.append(byname[curtest])
+        continue
+      total = byname[curtest]
+      for i in xrange(len(result)):
+        total[1][i] += result[i]
+      total[2]['FAIL'] += testlist['FAIL']
+      total[2]['XPASS'] += testlist['XPASS']
+      if 'OUTCOMES' in testlist:
+        total[2]['OUTCOMES'][0].extend(testlist['OUTCOMES'][0])
+        total[2]['OUTCOMES'][1].extend(testlist['OUTCOMES'][1])
+  return merged
+
+""" Scans one .sum or .log file, given as a (filename, prefix, capture)
+tuple, and returns its sets of results. The file is mapped into memory and
+only the lines the parser acts on are picked out of it, so (unless capturing
+every outcome) PASS lines and the rest of a log are never copied. This is a
+module level function so that it can be handed to a multiprocessing pool. """
+def _scanSummary(job):
+  filename, prefix, capture = job
+  parser = outputParser(prefix, capture)
+  lines = _SUMMARY_LINE
+  if capture:
+    lines = _CAPTURE_LINE
+  f = open(filename, 'rb')
+  try:
+    # Empty files cannot be mapped, and have nothing in them anyway
+    if os.fstat(f.fileno()).st_size == 0:
+      return []
+    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      for match in lines.finditer(m):
+        parser.feed(match.group(0))
+    finally:
+      m.close()
+  finally:
+    f.close()
+  return parser.finish()
+
+""" Incremental parser for DejaGnu output.
+
+Lines are passed to feed() one at a time as they are read. Each set of
+results is moved to the sections list, as a (name, result, testlist) tuple,
+as soon as its summary block ends, so only the FAIL and XPASS names of the
+current set are held. finish() completes any set still open and returns the
+list of sections in the order they appeared.
+
+If capture is true, the name and outcome code of every test are also kept,
+as an OUTCOMES entry in each set's testlist holding a list of names and a
+bytearray of codes in the order the tests were run.
+
+The time between 'Running <file>.exp ...' lines is also recorded, giving the
+total time taken by each .exp file (by name) in durations, as are the start
+and end times of each set of results, as (name, start, end) tuples in
+spans. """
+class outputParser:
+  # Tool summary; per-target "Summary for" blocks do not end a set
+  _SUMMARY = re.compile('\s*=== .* Summary ===\s*$')
+  _NEWTEST = re.compile('\s*=== (.*) tests ===\s*?')
+
+  def __init__(self, prefix, capture=False):
+    self.prefix = prefix
+    self.capture = capture
+    self.sections = []
+    self.curtest = None
+    self.insummary = False
+    # pass, xfail, xpass, fail, unresolved, untested, unsupport
+    self.result = [0, 0, 0, 0, 0, 0, 0]
+    # FAIL, XPASS
+    self.testlist = {'FAIL': [], 'XPASS': []}
+    if capture:
+      self.testlist['OUTCOMES'] = ([], bytearray())
+    self.durations = {}
+    self.spans = []
+    self.sectionstart = None
+    self.curexp = None
+    self.expstart = None
+
+  """ Consumes one line of output (without its trailing newline). """
+  def feed(self, line):
+    if line[:8] == 'Running ' and line[-8:] == '.exp ...':
+      self.endExp()
+      self.curexp = os.path.basename(line[8:-4])
+      self.expstart = time.time()
+    newtest = self._NEWTEST.match(line)
+    # If we have a new test, save previous result if any
+    if newtest:
+      self.endSection()
+      self.sectionstart = time.time()
+      # Calculate new test name
+      if self.prefix != None and self.prefix != 'None':
+        self.curtest = self.prefix + newtest.groups()[0]
+      else:
+        self.curtest = newtest.groups()[0]
+      return
+    if self.curtest == None:
+      return
+    result = self.result
+
+    if 'of expected passes' in line:
+      result[0] = int(line.replace('# of expected passes',''))
+    elif 'of unexpected failures' in line:
+      result[1] = int(line.replace('# of unexpected failures',''))
+    elif 'of unexpected successes' in line:
+      result[2] = int(line.replace('# of unexpected successes',''))
+    elif 'of expected failures' in line:
+      result[3] = int(line.replace('# of expected failures',''))
+    elif 'of unresolved testcases' in line:
+      result[4] = int(line.replace('# of unresolved testcases',''))
+    elif 'of untested testcases' in line:
+      result[5] = int(line.replace('# of untested testcases',''))
+    elif 'of unsupported tests' in line:
+      result[6] = int(line.replace('# of unsupported tests',''))
+    elif self.insummary:
+      # The first other non-blank line ends the summary, and so the set
+      if line.strip() != '':
+        self.endSection()
+    else:
+      if self.capture:
+        self.record(line)
+      if line[:6] == 'FAIL: ':
+        self.testlist['FAIL'].append(line[6:])
+      elif line[:7] == 'XPASS: ':
+        self.testlist['XPASS'].append(line[7:])
+      elif self._SUMMARY.match(line):
+        self.insummary = True
+
+  """ Records the outcome of a test, if the line is a test result. """
+  def record(self, line):
+    colon = line.find(': ')
+    if colon > 0:
+      code = outcomes.CODES.get(line[:colon])
+      if code != None:
+        names, codes = self.testlist['OUTCOMES']
+        names.append(line[colon+2:])
+        codes.append(code)
+
+  """ Stores the current set of results, if any, and starts a new one. """
+  def endSection(self):
+    if self.curtest:
+      self.sections.append((self.curtest, self.result, self.testlist))
+      self.spans.append((self.curtest, self.sectionstart, time.time()))
+    self.curtest = None
+    self.insummary = False
+    self.result = [0, 0, 0, 0, 0, 0, 0]
+    self.testlist = {'FAIL': [], 'XPASS': []}
+    if self.capture:
+      self.testlist['OUTCOMES'] = ([], bytearray())
+
+  """ Records the time taken by the current .exp file, if any. """
+  def endExp(self):
+    if self.curexp:
+      self.durations[self.curexp] = self.durations.get(self.curexp, 0.0) + \
+        time.time() - self.expstart
+    self.curexp = None
+
+  """ Finished processing output, returns all sets of results. """
+  def finish(self):
+    self.endExp()
+    self.endSection()
+    return self.sections